@@ -5,6 +5,7 @@ class Config:
     bpe_vi_embedding='./embedding/models/bpe_vi'
     bpe_en_embedding='./embedding/models/bpe_en'
     save_dir = '/content/drive/MyDrive/MT/saved_models'
+    data_bin_dir = './data-bin'
     bos_token='<s>'
     eos_token='</s>'
     pad_token='<pad>'
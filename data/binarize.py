@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import torch
+
+
+def binarize(tokenizer, texts, path, chunk_size=10000, workers=1):
+    """
+    tokenize texts once and write the token ids to path.bin (flat int32) and path.idx (int64 offsets),
+    sentence i is bin[idx[i]: idx[i + 1]]
+    :param tokenizer: tokenizer._tokenizer.Tokenizer
+    :param texts: iterable of sentences
+    :param path: output path without extension
+    :param chunk_size: number of sentences sent to a worker at once
+    :param workers: number of tokenization processes, see Tokenizer.tokenize_many
+    :return: number of sentences written
+    """
+    dir = os.path.dirname(path)
+    if dir:
+        os.makedirs(dir, exist_ok=True)
+
+    offsets = [0]
+    with open(path + '.bin', 'wb') as f:
+        for sent in tokenizer.tokenize_many(texts, workers=workers, chunksize=chunk_size):
+            f.write(sent.astype(np.int32).tobytes())
+            offsets.append(offsets[-1] + len(sent))
+
+    np.asarray(offsets, dtype=np.int64).tofile(path + '.idx')
+    return len(offsets) - 1
+
+
+class BinaryCorpus:
+    def __init__(self, path):
+        """
+        memory-mapped corpus written by binarize, sentences are read lazily from disk
+        and the pages are shared between processes
+        :param path: path without extension
+        """
+        self.offsets = np.fromfile(path + '.idx', dtype=np.int64)
+        if self.offsets[-1] > 0:
+            # copy-on-write mapping, slices are writable numpy arrays without copying the file
+            self.data = np.memmap(path + '.bin', dtype=np.int32, mode='c')
+        else:
+            self.data = np.zeros(0, dtype=np.int32)
+        self.lens = np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.lens)
+
+    def array(self, i):
+        """
+        :return: int32 view of sentence i on the mapped file, no copy
+        """
+        return self.data[self.offsets[i]: self.offsets[i + 1]]
+
+    def __getitem__(self, i):
+        """
+        :return: LongTensor of sentence i, as Tokenizer.tokenize gives
+        """
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return torch.from_numpy(self.array(i)).long()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,51 @@
+import hashlib
+from itertools import zip_longest
+
+
+VLSP2020_EN_DIRS = ['./MT-EV-VLSP2020/basic/data.en', './MT-EV-VLSP2020/evbcorpus/data.en',
+                    './MT-EV-VLSP2020/indomain-news/dev.en', './MT-EV-VLSP2020/indomain-news/train.en',
+                    './MT-EV-VLSP2020/indomain-news/tst.en', './MT-EV-VLSP2020/openSub/data.en',
+                    './MT-EV-VLSP2020/ted-like/data.en', './MT-EV-VLSP2020/wiki-alt/data.en']
+
+
+def get_split(en, vi, test_ratio=0.1, valid_ratio=0.05, seed=222):
+    """
+    deterministic train/valid/test assignment of a sentence pair by hashing its text,
+    valid_ratio is taken from what is left after the test split, as train_test_split twice would
+    :return: 'train', 'valid' or 'test'
+    """
+    digest = hashlib.md5('{}\t{}\t{}'.format(seed, en, vi).encode('utf8')).digest()
+    u = int.from_bytes(digest[:8], 'big') / 2 ** 64
+    if u < test_ratio:
+        return 'test'
+    if u < test_ratio + (1 - test_ratio) * valid_ratio:
+        return 'valid'
+    return 'train'
+
+
+def iter_parallel_corpus(en_dirs=VLSP2020_EN_DIRS, num_shards=1, shard_id=0):
+    """
+    lazily iterate aligned (en, vi) lines of all sources, the vi file of x.en is x.vi
+    :param num_shards: number of workers reading the corpus
+    :param shard_id: this worker only gets the pairs whose line number % num_shards == shard_id
+    """
+    line = 0
+    for en_dir in en_dirs:
+        vi_dir = en_dir[:-2] + 'vi'
+        with open(en_dir, encoding='utf8') as f_en, open(vi_dir, encoding='utf8') as f_vi:
+            for en, vi in zip_longest(f_en, f_vi):
+                assert en is not None and vi is not None, '{} and {} are not aligned'.format(en_dir, vi_dir)
+                if line % num_shards == shard_id:
+                    yield en.rstrip('\n'), vi.rstrip('\n')
+                line += 1
+
+
+def iter_split(split, en_dirs=VLSP2020_EN_DIRS, test_ratio=0.1, valid_ratio=0.05, seed=222, num_shards=1,
+               shard_id=0):
+    """
+    lazily iterate the (en, vi) pairs of one split, see get_split and iter_parallel_corpus
+    :param split: 'train', 'valid' or 'test'
+    """
+    for en, vi in iter_parallel_corpus(en_dirs, num_shards, shard_id):
+        if get_split(en, vi, test_ratio, valid_ratio, seed) == split:
+            yield en, vi
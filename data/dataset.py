@@ -0,0 +1,66 @@
+import torch
+
+from torch.nn.utils.rnn import pad_sequence
+from torch.utils.data import Dataset, DataLoader
+
+from data.sampler import BucketBatchSampler
+
+
+class TranslationDataset(Dataset):
+    def __init__(self, src_texts, dst_texts, src_tokenizer, dst_tokenizer):
+        """
+        raw parallel sentences, tokenized on access so the work is done by the DataLoader workers
+        :param src_texts: list of source sentence
+        :param dst_texts: list of target sentence, aligned with src_texts
+        :param src_tokenizer: tokenizer._tokenizer.Tokenizer
+        :param dst_tokenizer: tokenizer._tokenizer.Tokenizer
+        """
+        assert len(src_texts) == len(dst_texts)
+        self.src_texts = src_texts
+        self.dst_texts = dst_texts
+        self.src_tokenizer = src_tokenizer
+        self.dst_tokenizer = dst_tokenizer
+
+    def __len__(self):
+        return len(self.src_texts)
+
+    def __getitem__(self, i):
+        return self.src_tokenizer.tokenize(self.src_texts[i])[0], self.dst_tokenizer.tokenize(self.dst_texts[i])[0]
+
+
+class Collate:
+    def __init__(self, pad_idx=1):
+        self.pad_idx = pad_idx
+
+    def pad(self, sents):
+        lens = torch.LongTensor([len(sent) for sent in sents])
+        padded = pad_sequence(sents, batch_first=True, padding_value=self.pad_idx)
+        mask = torch.arange(padded.shape[1]).unsqueeze(0) < lens.unsqueeze(1)
+        return padded, lens, mask
+
+    def __call__(self, batch):
+        """
+        :param batch: list of (source tensor, target tensor)
+        :return: dict of the source and target as lists of tensor (the input of forward_and_get_loss),
+                 and as padded tensors [batch size, max len] with their lengths and masks
+        """
+        src, dst = [list(i) for i in zip(*batch)]
+        src_padded, src_lens, src_mask = self.pad(src)
+        dst_padded, dst_lens, dst_mask = self.pad(dst)
+        return {'src': src, 'dst': dst,
+                'src_padded': src_padded, 'src_lens': src_lens, 'src_mask': src_mask,
+                'dst_padded': dst_padded, 'dst_lens': dst_lens, 'dst_mask': dst_mask}
+
+
+def get_data_loader(dataset: TranslationDataset, batch_size=8, max_tokens=None, shuffle=True, num_workers=4,
+                    pad_idx=1, seed=222):
+    """
+    DataLoader tokenizing in num_workers processes, each worker prefetches batches ahead of the training step.
+    Batches are formed by length (see BucketBatchSampler) from a cheap whitespace length estimate,
+    call loader.batch_sampler.set_epoch(epoch) to reshuffle
+    """
+    src_lens = [len(text.split()) for text in dataset.src_texts]
+    dst_lens = [len(text.split()) for text in dataset.dst_texts]
+    batch_sampler = BucketBatchSampler(src_lens, dst_lens, batch_size=batch_size, max_tokens=max_tokens,
+                                       shuffle=shuffle, seed=seed)
+    return DataLoader(dataset, batch_sampler=batch_sampler, collate_fn=Collate(pad_idx), num_workers=num_workers)
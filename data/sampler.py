@@ -0,0 +1,63 @@
+import numpy as np
+
+from torch.utils.data import Sampler
+
+
+class BucketBatchSampler(Sampler):
+    def __init__(self, src_lens, dst_lens=None, batch_size=8, max_tokens=None, bucket_width=1, shuffle=True,
+                 seed=222, drop_last=False):
+        """
+        batch sampler grouping source/target pairs of similar length, so batches are padded as little as possible
+        :param src_lens: list of source sentence length
+        :param dst_lens: list of target sentence length, aligned with src_lens
+        :param batch_size: max number of pairs in a batch
+        :param max_tokens: if set, max number of padded tokens (batch size * longest sentence) in a batch
+        :param bucket_width: lengths are grouped by bucket_width, pairs are shuffled inside a bucket
+        :param shuffle: shuffle pairs inside buckets and the order of batches, different for each epoch
+        :param seed:
+        :param drop_last: drop the last batch if it is smaller than batch_size
+        """
+        self.src_lens = np.asarray(src_lens)
+        self.dst_lens = np.asarray(dst_lens) if dst_lens is not None else np.zeros_like(self.src_lens)
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.bucket_width = bucket_width
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _batches(self):
+        rng = np.random.RandomState(self.seed + self.epoch)
+        indices = rng.permutation(len(self.src_lens)) if self.shuffle else np.arange(len(self.src_lens))
+        # stable sort on (src bucket, dst bucket) keeps the random order inside a bucket
+        keys = (self.src_lens[indices] // self.bucket_width, self.dst_lens[indices] // self.bucket_width)
+        indices = indices[np.lexsort(keys[::-1])]
+
+        batches = []
+        batch = []
+        batch_max_len = 0
+        for i in indices.tolist():
+            max_len = max(batch_max_len, self.src_lens[i], self.dst_lens[i])
+            if batch and (len(batch) == self.batch_size or
+                          (self.max_tokens is not None and (len(batch) + 1) * max_len > self.max_tokens)):
+                batches.append(batch)
+                batch = []
+                max_len = max(self.src_lens[i], self.dst_lens[i])
+            batch.append(i)
+            batch_max_len = max_len
+        if batch and not (self.drop_last and len(batch) < self.batch_size):
+            batches.append(batch)
+
+        if self.shuffle:
+            rng.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        return iter(self._batches())
+
+    def __len__(self):
+        return len(self._batches())
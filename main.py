@@ -11,15 +11,21 @@ from sklearn.metrics import confusion_matrix
 from model.base_seq2seq import Seq2SeqModel as Seq2Seq_LSTM
 from tokenizer.BPE import BPE_VI, BPE_EN
 from tokenizer._tokenizer import Tokenizer
+from tokenizer.vocab import load_vocab
+from model.embedding import load_keyed_vectors, mmap_embedding, save_checkpoint, load_checkpoint
 from torch import nn
 from tqdm import tqdm
 from config import config
 
 from utils import get_text_data
+from data.binarize import binarize, BinaryCorpus
+from data.sampler import BucketBatchSampler
+from data.dataset import TranslationDataset, get_data_loader
 
 
 def get_embedding_models(dir):
-    return gensim.models.KeyedVectors.load(os.path.join(dir, 'word2vec.kv'))
+    # vectors are memory-mapped, see model/embedding.py
+    return load_keyed_vectors(dir)
 
 
 vi_embedding = get_embedding_models(config.bpe_vi_embedding)
@@ -31,11 +37,11 @@ dst_embedding = vi_embedding
 bpe_en = BPE_EN(padding=False)
 bpe_vi = BPE_VI(padding=False)
 
-tokenizer_en = Tokenizer(dict(zip(en_embedding.index2word, range(len(en_embedding.index2word)))), bpe_en)
-tokenizer_vi = Tokenizer(dict(zip(vi_embedding.index2word, range(len(vi_embedding.index2word)))), bpe_vi)
+tokenizer_en = Tokenizer(load_vocab(os.path.join(config.bpe_en_embedding, 'vocab'), en_embedding.index2word), bpe_en)
+tokenizer_vi = Tokenizer(load_vocab(os.path.join(config.bpe_vi_embedding, 'vocab'), vi_embedding.index2word), bpe_vi)
 
-model = Seq2Seq_LSTM(src_embedding=nn.Embedding.from_pretrained(torch.FloatTensor(en_embedding.vectors), padding_idx=1),
-                     dst_embedding=nn.Embedding.from_pretrained(torch.FloatTensor(vi_embedding.vectors), padding_idx=1),
+model = Seq2Seq_LSTM(src_embedding=mmap_embedding(en_embedding.vectors, padding_idx=1),
+                     dst_embedding=mmap_embedding(vi_embedding.vectors, padding_idx=1),
                      config=config)
 model.to(config.device)
 
@@ -56,9 +62,23 @@ print(tokenizer_vi.merge([i for i in model.predict(x, max_len=max_generated_len)
 # scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=1, gamma=0.82)
 #
 #
-# train_en_text, train_vi_text, valid_en_text, valid_vi_text, test_en_text, test_vi_text = get_text_data()
-# train_en, valid_en, test_en = [tokenizer_en.tokenize(i) for i in [train_en_text, valid_en_text, test_en_text]]
-# train_vi, valid_vi, test_vi = [tokenizer_vi.tokenize(i) for i in [train_vi_text, valid_vi_text, test_vi_text]]
+# # tokenize once, later runs load the binarized splits from config.data_bin_dir with memmap
+# if not os.path.exists(os.path.join(config.data_bin_dir, 'train.en.idx')):
+#     train_en_text, train_vi_text, valid_en_text, valid_vi_text, test_en_text, test_vi_text = get_text_data()
+#     for split, en_text, vi_text in [('train', train_en_text, train_vi_text), ('valid', valid_en_text, valid_vi_text),
+#                                     ('test', test_en_text, test_vi_text)]:
+#         binarize(tokenizer_en, en_text, os.path.join(config.data_bin_dir, split + '.en'), workers=os.cpu_count())
+#         binarize(tokenizer_vi, vi_text, os.path.join(config.data_bin_dir, split + '.vi'), workers=os.cpu_count())
+# train_en, valid_en, test_en = [BinaryCorpus(os.path.join(config.data_bin_dir, i + '.en')) for i in ['train', 'valid', 'test']]
+# train_vi, valid_vi, test_vi = [BinaryCorpus(os.path.join(config.data_bin_dir, i + '.vi')) for i in ['train', 'valid', 'test']]
+#
+# # or tokenize on the fly in DataLoader worker processes, batch['src'] / batch['dst'] go to forward_and_get_loss
+# # train_loader = get_data_loader(TranslationDataset(train_en_text, train_vi_text, tokenizer_en, tokenizer_vi),
+# #                                batch_size=config.batch_size, num_workers=4)
+# # for epoch in range(config.epochs):
+# #     train_loader.batch_sampler.set_epoch(epoch)
+# #     for batch in tqdm(train_loader):
+# #         outputs, loss = model.forward_and_get_loss(batch['src'], batch['dst'])
 #
 #
 # def eval(valid_en=valid_en, valid_vi=valid_vi, full_detail=False, confusion=False):
@@ -77,10 +97,11 @@ print(tokenizer_vi.merge([i for i in model.predict(x, max_len=max_generated_len)
 #         [i for i in model.predict(x, max_len=max_generated_len)])))
 #     print("Validating ...")
 #     with torch.no_grad():
-#         for i in tqdm(range(0, len(valid_en), config.batch_size)):
-#             # print(valid_vi_text[i: i + batch_size])
-#             outputs, loss = model.forward_and_get_loss(valid_en[i: i + batch_size],
-#                                                        valid_vi[i: i + batch_size],
+#         sampler = BucketBatchSampler([len(s) for s in valid_en], [len(s) for s in valid_vi],
+#                                      batch_size=batch_size, shuffle=False)
+#         for batch in tqdm(sampler):
+#             outputs, loss = model.forward_and_get_loss([valid_en[j] for j in batch],
+#                                                        [valid_vi[j] for j in batch],
 #                                                        )
 #
 #             total_loss.append(loss.item())
@@ -106,14 +127,17 @@ print(tokenizer_vi.merge([i for i in model.predict(x, max_len=max_generated_len)
 #     state_dict = copy.copy(model.state_dict())
 #     print_each = int(len(data) * config.print_interval)
 #     batch_size = config.batch_size
+#     # batches of pairs with similar length, shuffled at the bucket level
+#     sampler = BucketBatchSampler([len(s) for s in data], [len(s) for s in labels], batch_size=batch_size)
 #     for epoch in range(epochs):
 #         print('epoch:', epoch)
 #         print_counter = 0
 #         print_counter_ubound = print_each
-#         for i in tqdm(range(0, len(data), batch_size)):
-#             print_counter += batch_size
-#             outputs, loss = model.forward_and_get_loss(data[i: i + batch_size],
-#                                                        labels[i: i + batch_size],
+#         sampler.set_epoch(epoch)
+#         for i, batch in enumerate(tqdm(sampler)):
+#             print_counter += len(batch)
+#             outputs, loss = model.forward_and_get_loss([data[j] for j in batch],
+#                                                        [labels[j] for j in batch],
 #                                                        )
 #             optimizer.zero_grad()
 #             loss.backward()
@@ -129,11 +153,11 @@ print(tokenizer_vi.merge([i for i in model.predict(x, max_len=max_generated_len)
 #         print('dev_loss:', dev_loss)
 #         print('\n')
 #         if dev_loss < best_dev_loss:
-#             torch.save(model.state_dict(), os.path.join(config.save_dir, 'best-model.pt'))
+#             save_checkpoint(model, os.path.join(config.save_dir, 'best-model.pt'))
 #             best_dev_loss = dev_loss
 #         all_total_loss.append(total_loss)
 #         total_loss = []
-#     model.load_state_dict(torch.load(os.path.join(config.save_dir, 'best-model.pt')))
+#     load_checkpoint(model, os.path.join(config.save_dir, 'best-model.pt'))
 #     model.to(config.device)
 #     model.eval()
 #
@@ -1,11 +1,16 @@
 import torch
 
 from argparse import Namespace
+from functools import partial
 from torch import nn
 from torch.nn.utils.rnn import pad_sequence, pad_packed_sequence, pack_padded_sequence
 from typing import List
 import numpy as np
 
+import torch.nn.functional as F
+
+from model.beam_search import beam_search, max_output_lengths
+
 
 
 class Seq2SeqModel(nn.Module):
@@ -59,12 +64,33 @@ class Seq2SeqModel(nn.Module):
 
         return self.softmax(decoder_outputs), loss
 
-    def predict(self, x, max_len=50, beam_size=5):
-        outputs = []
-        for x_i in x:
-            outputs.append(self.predict_one_sentence(x_i, max_len, beam_size))
-
-        return outputs
+    def predict(self, x, max_len=50, beam_size=5, length_penalty=1.0, max_len_ratio=None, max_len_offset=10,
+                shortlist=None):
+        """
+        :param max_len_ratio: if set, the length budget of each sentence is
+                              min(max_len, max_len_ratio * source len + max_len_offset)
+        :param length_penalty: hypotheses are ranked by log prob / len ** length_penalty
+        :param shortlist: model.shortlist.Shortlist, if given the output projection is restricted to
+                          the candidate target vocabulary of this request
+        """
+        if len(x) == 0:
+            return []
+
+        with torch.no_grad():
+            encoder_outputs, (h, c) = self.encoder_forward(x)
+            # expand to beam size, beams of the same sentence are contiguous
+            beam_indices = torch.arange(len(x), device=h.device).repeat_interleave(beam_size)
+            hidden = (h.index_select(1, beam_indices), c.index_select(1, beam_indices))
+            # hidden = [num layers, batch size * beam size, dec hid dim]
+
+            step, vocab = self.decode_step, None
+            if shortlist is not None:
+                vocab = shortlist.candidates(x).to(h.device)
+                step = partial(self.decode_step, vocab=vocab)
+
+            return beam_search(step, hidden, (), len(x), beam_size,
+                               max_output_lengths(x, max_len, max_len_ratio, max_len_offset),
+                               self.bos_idx, self.eos_idx, length_penalty, vocab)
 
     def predict_one_sentence_(self, x, max_len=50, beam_size=5):
         encoder_outputs, hidden = self.encoder_forward([x])
@@ -95,34 +121,8 @@ class Seq2SeqModel(nn.Module):
 
         return hidden, topk_output_indices, topk_output_values
 
-    def predict_one_sentence(self, x, max_len=50, beam_size=5):
-        encoder_outputs, hidden = self.encoder_forward([x])
-        decoder_inputs = [torch.LongTensor([self.bos_idx])]
-        # decoder_inputs shape (1, 1)
-
-        hidden, topk_output_indices, topk_output_values = self.predict_one_token(decoder_inputs, hidden, beam_size)
-        res = []
-        for i in range(len(topk_output_indices)):
-            res.append([[topk_output_indices[i]], self.normalize_prob(topk_output_values[i]), hidden])
-
-        for i in range(1, max_len):
-            candidates = res[:]
-            for pos in range(len(res)):
-                input_ids, accumulate_prob, hidden = res[pos]
-                input_id = input_ids[-1]
-                decoder_inputs = [torch.LongTensor([input_id])]
-                if input_id != self.eos_idx:
-                    new_hidden, topk_output_indices, topk_output_values = self.predict_one_token(decoder_inputs, hidden,
-                                                                                                 beam_size)
-                    for i in range(len(topk_output_indices)):
-                        candidates.append([input_ids[:] + [topk_output_indices[i]],
-                                           (accumulate_prob + self.normalize_prob(topk_output_values[i])),  # normalize with len
-                                           new_hidden])
-
-            candidates.sort(key=lambda x: x[1], reverse=True)
-            res = candidates[:beam_size]
-
-        return res[0][0]
+    def predict_one_sentence(self, x, max_len=50, beam_size=5, **kwargs):
+        return self.predict([x], max_len, beam_size, **kwargs)[0]
 
     def encoder_forward(self, x):
         if self.device == 'cuda':
@@ -166,6 +166,30 @@ class Seq2SeqModel(nn.Module):
         out = self.linear(out)
         return out, hidden
 
+    def decode_step(self, token_ids, hidden, vocab=None):
+        # token_ids = [batch size], one token per sequence, so no padding or packing is needed
+        # hidden = [num layers, batch size, dec hid dim]
+        # vocab = LongTensor of the shortlisted target ids, output is restricted to them if given
+        if self.device == 'cuda':
+            token_ids = token_ids.cuda()
+
+        decoder_inputs = self.dst_embedding(token_ids.unsqueeze(1))
+        # decoder_inputs = [batch size, 1, emb dim]
+        out, hidden = self.decoder(decoder_inputs, hidden)
+        out = self.project(out.squeeze(1), vocab)
+        # out = [batch size, output dim or len(vocab)]
+
+        return torch.log_softmax(out, dim=-1), hidden
+
+    def project(self, out, vocab=None):
+        # output projection, restricted to the rows of the shortlisted target ids if vocab is given
+        if vocab is None:
+            return self.linear(out)
+        if not isinstance(self.linear, nn.Linear):
+            # int8 dynamic quantized linear, its packed weight cannot be sliced
+            return self.linear(out).index_select(-1, vocab)
+        return F.linear(out, self.linear.weight.index_select(0, vocab), self.linear.bias.index_select(0, vocab))
+
     # def forward(self, x: List[torch.LongTensor], y: List[torch.LongTensor] = None, max_len=20, beam_size=None):
     #     out_packed, (h, c) = self.encoder_forward(x)
     #
@@ -0,0 +1,117 @@
+import torch
+
+
+def max_output_lengths(x, max_len, max_len_ratio=None, max_len_offset=10):
+    """
+    length budget of each sentence, min(max_len, max_len_ratio * source len + max_len_offset)
+    :param x: list of source tensor
+    :return: a list (batch) of int
+    """
+    if max_len_ratio is None:
+        return [max_len] * len(x)
+    return [max(1, min(max_len, int(max_len_ratio * len(x_i) + max_len_offset))) for x_i in x]
+
+
+def beam_search(step, hidden, memory, batch_size, beam_size, max_len, bos_idx, eos_idx, length_penalty=1.0,
+                vocab=None):
+    """
+    batched beam search, all sentences x beams are decoded together as one (batch * beam) batch
+    :param step: function (input_ids, hidden, *memory) -> (log_probs, hidden)
+                 input_ids = [batch size * beam size], log_probs = [batch size * beam size, vocab size]
+    :param hidden: tuple of decoder states, each of shape [num layers, batch size * beam size, dim],
+                   beams of the same sentence are contiguous
+    :param memory: tuple of tensors of shape [batch size * beam size, ...] passed to step as they are,
+                   e.g. encoder outputs
+    :param max_len: int, or a list (batch) of int, max number of generated tokens of each sentence
+    :param length_penalty: hypotheses are ranked by score / len ** length_penalty
+    :param vocab: LongTensor of the target ids log_probs are over when decoding with a shortlist,
+                  None for the full vocabulary
+    :return: a list (batch) of list of token ids, the best hypothesis of each sentence
+    """
+    if isinstance(max_len, int):
+        max_len = [max_len] * batch_size
+    device = hidden[0].device
+
+    def normalize(score, length):
+        return score / length ** length_penalty
+
+    # finished hypotheses of each sentence, as (normalized score, ids)
+    finished = [[] for _ in range(batch_size)]
+    # sentences still decoding, in the order of their rows
+    active = list(range(batch_size))
+
+    input_ids = torch.full((batch_size * beam_size,), bos_idx, dtype=torch.long, device=device)
+    # only the first beam is alive at the beginning, so the first step does not pick k times the same token
+    scores = torch.full((batch_size, beam_size), float('-inf'), device=device)
+    scores[:, 0] = 0
+    scores = scores.reshape(-1)
+    outputs = torch.zeros((batch_size * beam_size, 0), dtype=torch.long, device=device)
+    beam_offset = (torch.arange(batch_size, device=device) * beam_size).unsqueeze(1)
+
+    for length in range(1, max(max_len) + 1):
+        log_probs, hidden = step(input_ids, hidden, *memory)
+        vocab_size = log_probs.shape[-1]
+
+        candidates = (scores.unsqueeze(1) + log_probs).reshape(len(active), -1)
+        # candidates = [num active, beam size * vocab size]
+        # 2 * beam size candidates leave at least beam size ones not ending with eos
+        cand_scores, cand_indices = torch.topk(candidates, k=min(2 * beam_size, candidates.shape[1]), dim=-1)
+        cand_rows = cand_indices // vocab_size + beam_offset[:len(active)]
+        cand_tokens = cand_indices % vocab_size
+        if vocab is not None:
+            cand_tokens = vocab[cand_tokens]
+        cand_eos = cand_tokens == eos_idx
+
+        # candidates ending with eos among the best beam size ones are finished
+        for row, pos in cand_eos[:, :beam_size].nonzero().tolist():
+            ids = outputs[cand_rows[row, pos]].tolist() + [eos_idx]
+            finished[active[row]].append((normalize(cand_scores[row, pos].item(), length), ids))
+
+        # the best beam size candidates not ending with eos stay alive
+        live_scores, live_pos = torch.topk(cand_scores.masked_fill(cand_eos, float('-inf')), k=beam_size, dim=-1)
+        beam_indices = cand_rows.gather(1, live_pos).reshape(-1)
+        input_ids = cand_tokens.gather(1, live_pos).reshape(-1)
+        scores = live_scores.reshape(-1)
+
+        outputs = torch.cat([outputs.index_select(0, beam_indices), input_ids.unsqueeze(1)], dim=1)
+        hidden = tuple(h.index_select(1, beam_indices) for h in hidden)
+
+        keep = []
+        best_live_scores = live_scores[:, 0].tolist()
+        for row, sent in enumerate(active):
+            if length >= max_len[sent]:
+                # out of length budget, live hypotheses compete as they are
+                start, end = row * beam_size, (row + 1) * beam_size
+                for ids, score in zip(outputs[start:end].tolist(), scores[start:end].tolist()):
+                    finished[sent].append((normalize(score, length), ids))
+                continue
+
+            if finished[sent]:
+                # log probs are <= 0, so the score of a live hypothesis can only go down,
+                # its normalized score is bounded by the best of the remaining lengths
+                best_live = best_live_scores[row]
+                bound = max(normalize(best_live, length + 1), normalize(best_live, max_len[sent]))
+                if max(score for score, _ in finished[sent]) >= bound:
+                    continue
+
+            keep.append(row)
+
+        if len(keep) == 0:
+            break
+
+        if len(keep) < len(active):
+            # drop the rows of done sentences
+            rows = (torch.LongTensor(keep).to(device).unsqueeze(1) * beam_size +
+                    torch.arange(beam_size, device=device)).reshape(-1)
+            input_ids = input_ids.index_select(0, rows)
+            scores = scores.index_select(0, rows)
+            outputs = outputs.index_select(0, rows)
+            hidden = tuple(h.index_select(1, rows) for h in hidden)
+            memory = tuple(m.index_select(0, rows) for m in memory)
+            active = [active[row] for row in keep]
+
+    res = []
+    for hypotheses in finished:
+        res.append(max(hypotheses, key=lambda x: x[0])[1] if hypotheses else [])
+
+    return res
@@ -0,0 +1,70 @@
+import logging
+import os
+
+import numpy as np
+import torch
+
+from torch import nn
+
+
+def load_keyed_vectors(dir, mmap='c'):
+    """
+    load dir/word2vec.kv with the vectors memory-mapped instead of read into memory
+    :param mmap: 'c' copy-on-write, pages are shared between processes until a process writes to them
+                 (load_state_dict does), 'r' read only
+    """
+    from gensim.models import KeyedVectors
+    return KeyedVectors.load(os.path.join(dir, 'word2vec.kv'), mmap=mmap)
+
+
+def mmap_embedding(vectors: np.ndarray, padding_idx=1):
+    """
+    frozen nn.Embedding whose weight is vectors itself, no copy, forked workers share the mapped pages
+    :param vectors: [vocab size, embedding dim] numpy array, as KeyedVectors.vectors from load_keyed_vectors
+    """
+    if vectors.dtype != np.float32:
+        # torch.FloatTensor would copy anyway
+        vectors = vectors.astype(np.float32)
+    return nn.Embedding.from_pretrained(torch.from_numpy(vectors), freeze=True, padding_idx=padding_idx)
+
+
+# weights of the frozen embeddings, left out of checkpoints: they are the mapped vectors, which load_state_dict
+# would overwrite with a private copy
+EMBEDDING_KEYS = ['src_embedding.weight', 'dst_embedding.weight']
+
+
+def save_checkpoint(model: nn.Module, path):
+    """
+    state dict of model without the frozen embeddings, see load_checkpoint
+    """
+    state_dict = model.state_dict()
+    for key in EMBEDDING_KEYS:
+        state_dict.pop(key, None)
+    torch.save(state_dict, path)
+
+
+def load_checkpoint(model: nn.Module, path, map_location=None):
+    """
+    load a checkpoint into a model built with mmap_embedding, its embeddings are kept as they are (shared pages)
+    when the checkpoint has none (save_checkpoint) or the same ones.
+    A checkpoint with other embeddings (trained before init_weights kept the pretrained vectors, the embeddings
+    were then random) gets them: they replace the mapped tensors, which are not written
+    """
+    state_dict = torch.load(path, map_location=map_location)
+    for key in EMBEDDING_KEYS:
+        if key not in state_dict:
+            continue
+        weight = state_dict.pop(key)
+        module = getattr(model, key.split('.')[0])
+        if module.weight.shape != weight.shape:
+            raise RuntimeError('checkpoint {}: {} of shape {} does not match the model, {}'.format(
+                path, key, tuple(weight.shape), tuple(module.weight.shape)))
+        if not torch.equal(module.weight, weight.to(module.weight.device)):
+            logging.warning('checkpoint %s: %s differs from the pretrained vectors, the checkpoint one is used',
+                            path, key)
+            module.weight = nn.Parameter(weight.to(module.weight.device), requires_grad=module.weight.requires_grad)
+    result = model.load_state_dict(state_dict, strict=False)
+    missing_keys = [key for key in result.missing_keys if key not in EMBEDDING_KEYS]
+    if missing_keys or result.unexpected_keys:
+        raise RuntimeError('checkpoint {} does not match the model, missing keys {}, unexpected keys {}'.format(
+            path, missing_keys, result.unexpected_keys))
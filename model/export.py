@@ -0,0 +1,171 @@
+import json
+import os
+from typing import List, Tuple
+
+import torch
+
+from torch import nn, Tensor
+from torch.nn.utils.rnn import pad_sequence, pad_packed_sequence, pack_padded_sequence
+import torch.nn.functional as F
+
+from model.beam_search import beam_search, max_output_lengths
+
+
+# TorchScript export of the encoder and of one decoder step, for serving.
+# The exported files only need torch (and model/beam_search.py for ScriptedModel) to run,
+# not the training code in base_seq2seq.py / seq2seq_attention.py.
+
+
+class Encoder(nn.Module):
+    def __init__(self, model):
+        super(Encoder, self).__init__()
+        self.embedding = model.src_embedding
+        self.encoder = model.encoder
+        self.num_layers = model.num_layers
+        self.direction = 2 if model.bidirectional else 1
+
+    def forward(self, x: Tensor, lens: Tensor) -> Tuple[Tensor, Tensor]:
+        # x = [batch size, max len], padded with padding idx
+        # lens = [batch size], on cpu
+        batch_size = x.shape[0]
+        packed = pack_padded_sequence(self.embedding(x), lens, batch_first=True, enforce_sorted=False)
+        out_packed, (h, c) = self.encoder(packed)
+        h = h.reshape(self.num_layers, self.direction, batch_size, -1).transpose(2, 1).reshape(self.num_layers,
+                                                                                               batch_size, -1)
+        c = c.reshape(self.num_layers, self.direction, batch_size, -1).transpose(2, 1).reshape(self.num_layers,
+                                                                                               batch_size, -1)
+        # h = c = [num layers, batch size, dec hid dim]
+        return h, c
+
+
+class DecoderStep(nn.Module):
+    def __init__(self, model):
+        super(DecoderStep, self).__init__()
+        self.embedding = model.dst_embedding
+        self.decoder = model.decoder
+        self.linear = model.linear
+
+    def forward(self, token_ids: Tensor, h: Tensor, c: Tensor) -> Tuple[Tensor, Tensor, Tensor]:
+        # token_ids = [batch size]
+        out, (h, c) = self.decoder(self.embedding(token_ids.unsqueeze(1)), (h, c))
+        out = self.linear(out.squeeze(1))
+        return torch.log_softmax(out, dim=-1), h, c
+
+
+class AttentionEncoder(nn.Module):
+    def __init__(self, model):
+        super(AttentionEncoder, self).__init__()
+        self.embedding = model.src_embedding
+        self.encoder = model.encoder
+        self.attn_keys = model.attention_layers.attn_keys
+        self.num_layers = model.num_layers
+        self.direction = model.encoder_direction
+        self.padding_idx = model.src_embedding.padding_idx
+
+    def forward(self, x: Tensor, lens: Tensor) -> Tuple[Tensor, Tensor, Tensor, Tensor, Tensor]:
+        # x = [batch size, max len], padded with padding idx
+        # lens = [batch size], on cpu
+        batch_size = x.shape[0]
+        mask = x != self.padding_idx
+        packed = pack_padded_sequence(self.embedding(x), lens, batch_first=True, enforce_sorted=False)
+        out_packed, (h, c) = self.encoder(packed)
+        out, _ = pad_packed_sequence(out_packed, batch_first=True, padding_value=float(self.padding_idx))
+        h = h.reshape(self.num_layers, self.direction, batch_size, -1).transpose(2, 1).reshape(self.num_layers,
+                                                                                               batch_size, -1)
+        c = c.reshape(self.num_layers, self.direction, batch_size, -1).transpose(2, 1).reshape(self.num_layers,
+                                                                                               batch_size, -1)
+        keys = self.attn_keys(out)
+        return out, h, c, mask, keys
+
+
+class AttentionDecoderStep(nn.Module):
+    def __init__(self, model):
+        super(AttentionDecoderStep, self).__init__()
+        self.embedding = model.dst_embedding
+        self.decoder = model.decoder
+        self.attn_query = model.attention_layers.attn_query
+        self.v = model.attention_layers.v
+        self.linear = model.linear
+
+    def forward(self, token_ids: Tensor, h: Tensor, c: Tensor, encoder_outputs: Tensor, mask: Tensor,
+                keys: Tensor) -> Tuple[Tensor, Tensor, Tensor]:
+        # token_ids = [batch size]
+        out, (h, c) = self.decoder(self.embedding(token_ids.unsqueeze(1)), (h, c))
+        # out = [batch size, 1, dec hid dim]
+
+        attention = self.v(torch.tanh(self.attn_query(out).unsqueeze(2) + keys.unsqueeze(1))).squeeze(3)
+        attention = F.softmax(attention.masked_fill(mask.unsqueeze(1) == 0, -1e10), dim=-1)
+        # attention = [batch size, 1, encoder_inputs len]
+        weighted = torch.bmm(attention, encoder_outputs)
+
+        out = self.linear(torch.cat([out, weighted], dim=-1).squeeze(1))
+        return torch.log_softmax(out, dim=-1), h, c
+
+
+def export(model, dir):
+    """
+    script the encoder and one decoder step of a model and save them to dir
+    :param model: Seq2SeqModel or Seq2SeqAttentionModel
+    :param dir: output directory, encoder.pt and decoder_step.pt are written there
+    """
+    model.eval()
+    attention = hasattr(model, 'attention_layers')
+    if attention:
+        encoder, decoder_step = AttentionEncoder(model), AttentionDecoderStep(model)
+        max_src_len = model.max_encoder_inputs_length
+    else:
+        encoder, decoder_step = Encoder(model), DecoderStep(model)
+        max_src_len = -1
+
+    extra_files = {'config': json.dumps({'attention': attention, 'bos_idx': model.bos_idx,
+                                         'eos_idx': model.eos_idx, 'pad_idx': model.src_embedding.padding_idx,
+                                         'max_src_len': max_src_len})}
+    os.makedirs(dir, exist_ok=True)
+    torch.jit.save(torch.jit.script(encoder), os.path.join(dir, 'encoder.pt'), _extra_files=extra_files)
+    torch.jit.save(torch.jit.script(decoder_step), os.path.join(dir, 'decoder_step.pt'))
+
+
+class ScriptedModel:
+    def __init__(self, dir):
+        """
+        load the files written by export, same predict as the training models
+        :param dir:
+        """
+        extra_files = {'config': ''}
+        self.encoder = torch.jit.load(os.path.join(dir, 'encoder.pt'), _extra_files=extra_files)
+        self.decoder_step = torch.jit.load(os.path.join(dir, 'decoder_step.pt'))
+        config = json.loads(extra_files['config'])
+        self.attention = config['attention']
+        self.bos_idx = config['bos_idx']
+        self.eos_idx = config['eos_idx']
+        self.pad_idx = config['pad_idx']
+        self.max_src_len = config['max_src_len']
+
+    def step(self, token_ids, hidden, *memory):
+        log_probs, h, c = self.decoder_step(token_ids, hidden[0], hidden[1], *memory)
+        return log_probs, (h, c)
+
+    def predict(self, x: List[Tensor], max_len=20, beam_size=5, length_penalty=1.0, max_len_ratio=None,
+                max_len_offset=10):
+        if len(x) == 0:
+            return []
+        max_len = max_output_lengths(x, max_len, max_len_ratio, max_len_offset)
+        if self.max_src_len > 0:
+            x = [i[:self.max_src_len] for i in x]
+
+        with torch.no_grad():
+            lens = torch.LongTensor([len(sent) for sent in x])
+            outputs = self.encoder(pad_sequence(x, batch_first=True, padding_value=self.pad_idx), lens)
+            if self.attention:
+                encoder_outputs, h, c, mask, keys = outputs
+                memory = (encoder_outputs, mask, keys)
+            else:
+                (h, c), memory = outputs, ()
+
+            # expand to beam size, beams of the same sentence are contiguous
+            beam_indices = torch.arange(len(x)).repeat_interleave(beam_size)
+            hidden = (h.index_select(1, beam_indices), c.index_select(1, beam_indices))
+            memory = tuple(m.index_select(0, beam_indices) for m in memory)
+
+            return beam_search(self.step, hidden, memory, len(x), beam_size, max_len,
+                               self.bos_idx, self.eos_idx, length_penalty)
@@ -0,0 +1,78 @@
+import inspect
+import io
+import time
+
+import numpy as np
+import torch
+
+from torch import nn
+
+
+def quantize_dynamic(model):
+    """
+    int8 dynamic quantization of the LSTMs and linear layers (encoder, decoder, attention, output projection)
+    for cpu inference, weights are stored in int8 and activations are quantized on the fly
+    :param model: Seq2SeqModel or Seq2SeqAttentionModel, trained float model
+    :return: a quantized copy of the model, on cpu
+    """
+    model.eval()
+    return torch.quantization.quantize_dynamic(model.cpu(), {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+
+# the packed weights of the quantized layers are ScriptObjects, which torch.load refuses since torch 2.6
+# (weights_only=True by default). Older versions have no weights_only and always unpickle everything
+_full_pickle = {'weights_only': False} if 'weights_only' in inspect.signature(torch.load).parameters else {}
+
+
+def save_quantized(model, path):
+    torch.save(model.state_dict(), path)
+
+
+def load_quantized(model, path):
+    """
+    :param model: freshly built float model with the same config as the saved one
+    :param path: checkpoint saved by save_quantized
+    :return: the quantized model with the saved weights
+    """
+    model = quantize_dynamic(model)
+    model.load_state_dict(torch.load(path, **_full_pickle))
+    return model
+
+
+def model_size(model):
+    """
+    :return: size in bytes of the serialized state dict
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def compare(float_model, quantized_model, x, y, batch_size=8, max_len=20, beam_size=5):
+    """
+    accuracy vs speed of the quantized model against the float one on a held-out set
+    :param x: list of source tensor
+    :param y: list of target tensor
+    :return: dict of loss, decoding time and size of both models, and the ratio of identical translations
+    """
+    res = {}
+    predictions = {}
+    for name, model in [('float', float_model), ('quantized', quantized_model)]:
+        model.eval()
+        total_loss = []
+        outputs = []
+        decoding_time = 0
+        with torch.no_grad():
+            for i in range(0, len(x), batch_size):
+                _, loss = model.forward_and_get_loss(x[i: i + batch_size], list(y[i: i + batch_size]))
+                total_loss.append(loss.item())
+
+                start = time.perf_counter()
+                outputs.extend(model.predict(x[i: i + batch_size], max_len=max_len, beam_size=beam_size))
+                decoding_time += time.perf_counter() - start
+
+        predictions[name] = outputs
+        res[name] = {'loss': np.mean(total_loss), 'decoding_time': decoding_time, 'size': model_size(model)}
+
+    res['same_translation'] = np.mean([p == q for p, q in zip(predictions['float'], predictions['quantized'])])
+    return res
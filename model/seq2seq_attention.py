@@ -1,3 +1,4 @@
+from functools import partial
 from typing import List
 
 import torch
@@ -8,6 +9,8 @@ import numpy as np
 
 import torch.nn.functional as F
 
+from model.beam_search import beam_search, max_output_lengths
+
 
 class Attention(nn.Module):
     def __init__(self, enc_hid_dim, dec_hid_dim, encoder_direction=2, dec_num_layers=2):
@@ -15,26 +18,53 @@ class Attention(nn.Module):
 
         self.encoder_direction = encoder_direction
         self.dec_num_layers = dec_num_layers
-        self.attn = nn.Linear((enc_hid_dim * self.encoder_direction) + dec_hid_dim, dec_hid_dim)
+        # attn(cat(hidden, encoder_outputs)) split into its hidden half (query, computed per decoder step)
+        # and its encoder_outputs half (keys, computed once per source sentence)
+        self.attn_query = nn.Linear(dec_hid_dim, dec_hid_dim, bias=False)
+        self.attn_keys = nn.Linear(enc_hid_dim * self.encoder_direction, dec_hid_dim)
         self.v = nn.Linear(dec_hid_dim, 1, bias=False)
 
-    def forward(self, hidden, encoder_outputs, mask):
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints saved before the split have a single attn layer over cat(hidden, encoder_outputs)
+        if prefix + 'attn.weight' in state_dict:
+            weight = state_dict.pop(prefix + 'attn.weight')
+            dec_hid_dim = self.attn_query.in_features
+            state_dict[prefix + 'attn_query.weight'] = weight[:, :dec_hid_dim]
+            state_dict[prefix + 'attn_keys.weight'] = weight[:, dec_hid_dim:]
+            state_dict[prefix + 'attn_keys.bias'] = state_dict.pop(prefix + 'attn.bias')
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def project_keys(self, encoder_outputs):
+        # encoder_outputs = [batch size, encoder_inputs len, enc hid dim * direction]
+        # keys = [batch size, encoder_inputs len, dec hid dim]
+        return self.attn_keys(encoder_outputs)
+
+    def forward(self, hidden, encoder_outputs, mask, keys=None):
         # hidden = [batch size, dec hid dim]
         # encoder_outputs = [batch size, encoder_inputs len, enc hid dim * direction]
         # mask = [bach_size, encoder_inputs len]
+        # keys = [batch size, encoder_inputs len, dec hid dim], from project_keys
+        # attention = [batch size, encoder_inputs len]
+        return self.forward_all(hidden.unsqueeze(1), encoder_outputs, mask, keys).squeeze(1)
 
-        encoder_inputs_len = encoder_outputs.shape[1]
+    def forward_all(self, hidden, encoder_outputs, mask, keys=None):
+        # hidden = [batch size, decoder_inputs len, dec hid dim]
+        # encoder_outputs = [batch size, encoder_inputs len, enc hid dim * direction]
+        # mask = [bach_size, encoder_inputs len]
+        # keys = [batch size, encoder_inputs len, dec hid dim], from project_keys
 
-        hidden = hidden.unsqueeze(1).repeat(1, encoder_inputs_len, 1)
-        # hidden = [batch size, encoder_inputs len, dec hid dim]
+        if keys is None:
+            keys = self.project_keys(encoder_outputs)
+        query = self.attn_query(hidden)
+        # query = [batch size, decoder_inputs len, dec hid dim]
 
-        # print(hidden.shape, encoder_outputs.shape)
-        attention = self.v(torch.tanh(self.attn(torch.cat((hidden, encoder_outputs), dim=2)))).squeeze(2)
-        # attention = [batch size, encoder_inputs len]
+        # every (decoder step, encoder position) pair is scored without repeating the inputs
+        attention = self.v(torch.tanh(query.unsqueeze(2) + keys.unsqueeze(1))).squeeze(3)
+        # attention = [batch size, decoder_inputs len, encoder_inputs len]
 
-        attention = attention.masked_fill(mask == 0, -1e10)
+        attention = attention.masked_fill(mask.unsqueeze(1) == 0, -1e10)
 
-        return F.softmax(attention, dim=1)
+        return F.softmax(attention, dim=-1)
 
 
 class Seq2SeqAttentionModel(nn.Module):
@@ -77,9 +107,17 @@ class Seq2SeqAttentionModel(nn.Module):
         self.beam_size = config.beam_size
         self.device = config.device
 
-    def init_weights(self):
+    def init_weights(self, init_frozen=False):
+        """
+        N(0, 0.01) weights and zero biases
+        :param init_frozen: also initialize the frozen parameters (the pretrained embeddings). Models trained before
+                            this parameter existed had their embeddings replaced by random ones, init_frozen=True
+                            reproduces that training; False keeps the pretrained vectors and their mapped pages
+        """
         def init_weights_(model):
             for name, param in model.named_parameters():
+                if not param.requires_grad and not init_frozen:
+                    continue
                 if 'weight' in name:
                     nn.init.normal_(param.data, mean=0, std=0.01)
                 else:
@@ -87,14 +125,14 @@ class Seq2SeqAttentionModel(nn.Module):
         self.apply(init_weights_)
 
     def forward_and_get_loss(self, x: List[torch.LongTensor], y: List[torch.LongTensor]):
-        encoder_outputs, hidden, mask = self.encoder_forward(x)
+        encoder_outputs, hidden, mask, keys = self.encoder_forward(x)
 
         for i in range(len(y)):
             if len(y[i]) > self.max_decoder_inputs_length:
                 y[i] = torch.cat([y[i][:self.max_decoder_inputs_length], torch.LongTensor([self.eos_idx])])
         decoder_inputs = [sent[:-1] for sent in y]
         decoder_target_outputs = [sent[1:] for sent in y]
-        decoder_outputs, hidden = self.decoder_forward(decoder_inputs, hidden, encoder_outputs, mask)
+        decoder_outputs, hidden = self.decoder_forward(decoder_inputs, hidden, encoder_outputs, mask, keys)
 
         if self.device == 'cuda':
             decoder_target_outputs = [i.cuda() for i in decoder_target_outputs]
@@ -106,21 +144,46 @@ class Seq2SeqAttentionModel(nn.Module):
 
         return self.softmax(decoder_outputs), loss
 
-    def predict(self, x, max_len=20, beam_size=5):
-        outputs = []
-        for x_i in x:
-            outputs.append(self.predict_one_sentence(x_i, max_len, beam_size))
-
-        return outputs
+    def predict(self, x, max_len=20, beam_size=5, length_penalty=1.0, max_len_ratio=None, max_len_offset=10,
+                shortlist=None):
+        """
+        :param max_len_ratio: if set, the length budget of each sentence is
+                              min(max_len, max_len_ratio * source len + max_len_offset)
+        :param length_penalty: hypotheses are ranked by log prob / len ** length_penalty
+        :param shortlist: model.shortlist.Shortlist, if given the output projection is restricted to
+                          the candidate target vocabulary of this request
+        """
+        if len(x) == 0:
+            return []
+
+        with torch.no_grad():
+            encoder_outputs, (h, c), mask, keys = self.encoder_forward(x)
+            # expand to beam size once, beams of the same sentence are contiguous
+            beam_indices = torch.arange(len(x), device=h.device).repeat_interleave(beam_size)
+            hidden = (h.index_select(1, beam_indices), c.index_select(1, beam_indices))
+            # hidden = [num layers, batch size * beam size, dec hid dim]
+            encoder_outputs = encoder_outputs.index_select(0, beam_indices)
+            # encoder_outputs = [batch size * beam size, encoder_inputs len, enc hid dim * direction]
+            mask = mask.index_select(0, beam_indices)
+            keys = keys.index_select(0, beam_indices)
+
+            step, vocab = self.decode_step, None
+            if shortlist is not None:
+                vocab = shortlist.candidates(x).to(h.device)
+                step = partial(self.decode_step, vocab=vocab)
+
+            return beam_search(step, hidden, (encoder_outputs, mask, keys), len(x), beam_size,
+                               max_output_lengths(x, max_len, max_len_ratio, max_len_offset),
+                               self.bos_idx, self.eos_idx, length_penalty, vocab)
 
     def predict_one_sentence_(self, x, max_len=20):
-        encoder_outputs, hidden, mask = self.encoder_forward([x])
+        encoder_outputs, hidden, mask, keys = self.encoder_forward([x])
         decoder_inputs = [torch.LongTensor([self.bos_idx])]
         # decoder_inputs shape (1, 1)
         outputs = []
 
         for i in range(1, max_len):
-            decoder_outputs, hidden = self.decoder_forward(decoder_inputs, hidden, encoder_outputs, mask)
+            decoder_outputs, hidden = self.decoder_forward(decoder_inputs, hidden, encoder_outputs, mask, keys)
             decoder_outputs = torch.topk(decoder_outputs.reshape((-1,)), k=1)
             decoder_outputs = decoder_outputs.indices.tolist()[0]
 
@@ -134,44 +197,16 @@ class Seq2SeqAttentionModel(nn.Module):
     def normalize_prob(self, prob):
         return np.log(1 + prob)
 
-    def predict_one_token(self, decoder_inputs, hidden, encoder_outputs, mask, beam_size=5):
-        decoder_outputs, hidden = self.decoder_forward(decoder_inputs, hidden, encoder_outputs, mask)
+    def predict_one_token(self, decoder_inputs, hidden, encoder_outputs, mask, beam_size=5, keys=None):
+        decoder_outputs, hidden = self.decoder_forward(decoder_inputs, hidden, encoder_outputs, mask, keys)
         decoder_outputs = torch.topk(self.softmax(decoder_outputs).reshape((-1,)), k=beam_size)
         topk_output_indices = decoder_outputs.indices.tolist()
         topk_output_values = decoder_outputs.values.tolist()
 
         return hidden, topk_output_indices, topk_output_values
 
-    def predict_one_sentence(self, x, max_len=50, beam_size=5):
-        encoder_outputs, hidden, mask = self.encoder_forward([x])
-        decoder_inputs = [torch.LongTensor([self.bos_idx])]
-        # decoder_inputs shape (1, 1)
-
-        hidden, topk_output_indices, topk_output_values = self.predict_one_token(decoder_inputs, hidden,
-                                                                                 encoder_outputs, mask, beam_size)
-        res = []
-        for i in range(len(topk_output_indices)):
-            res.append([[topk_output_indices[i]], self.normalize_prob(topk_output_values[i]), hidden])
-
-        for i in range(1, max_len):
-            candidates = res[:]
-            for pos in range(len(res)):
-                input_ids, accumulate_prob, hidden = res[pos]
-                input_id = input_ids[-1]
-                decoder_inputs = [torch.LongTensor([input_id])]
-                if input_id != self.eos_idx:
-                    new_hidden, topk_output_indices, topk_output_values = self.predict_one_token(decoder_inputs, hidden,
-                                                                                                 encoder_outputs, mask,
-                                                                                                 beam_size)
-                    for i in range(len(topk_output_indices)):
-                        candidates.append([input_ids[:] + [topk_output_indices[i]],
-                                           (accumulate_prob + self.normalize_prob(topk_output_values[i])),  # normalize with len
-                                           new_hidden])
-
-            candidates.sort(key=lambda x: x[1], reverse=True)
-            res = candidates[:beam_size]
-
-        return res[0][0]
+    def predict_one_sentence(self, x, max_len=50, beam_size=5, **kwargs):
+        return self.predict([x], max_len, beam_size, **kwargs)[0]
 
     def create_mask(self, encoder_inputs):
         mask = (encoder_inputs != self.src_embedding.padding_idx)
@@ -201,14 +236,17 @@ class Seq2SeqAttentionModel(nn.Module):
         # h = [num layers, seq len, enc hid dim * direction] = c
         c = c.reshape(self.num_layers, self.encoder_direction, len(lens), -1).transpose(2, 1).reshape(self.num_layers,
                                                                                               len(lens), -1)
+        keys = self.attention_layers.project_keys(out)
+        # keys = [batch size, encoder_inputs len, dec hid dim]
 
-        return out, (h, c), mask
+        return out, (h, c), mask, keys
 
-    def decoder_forward(self, decoder_inputs, hidden, encoder_outputs, mask):
+    def decoder_forward(self, decoder_inputs, hidden, encoder_outputs, mask, keys=None):
         # decoder_inputs: list of tensor
         # hidden = [num layers, batch size, dec hid dim]
         # encoder_outputs = [batch size, encoder_inputs len, enc hid dim * direction]
         # mask = [batch size, encoder_inputs len]
+        # keys = [batch size, encoder_inputs len, dec hid dim], cached attention keys from encoder_forward
 
         # decoder_inputs = [i[:self.max_decoder_inputs_length] for i in decoder_inputs]
         if self.device == 'cuda':
@@ -228,31 +266,56 @@ class Seq2SeqAttentionModel(nn.Module):
                                                padding_value=self.dst_embedding.padding_idx)
         # out = [batch size, decoder_inputs seq len, dec hid dim]
 
-        all_attention = []
-        attention_hidden_inputs = out.permute(1, 0, 2)
-        for i in range(len(attention_hidden_inputs)):
-            attention_hidden_input = attention_hidden_inputs[i]
-            attention_outputs = self.attention_layers(attention_hidden_input, encoder_outputs, mask).unsqueeze(1)
-            # attention_outputs = [batch size, 1, encoder_inputs len]
-
-            weighted = torch.bmm(attention_outputs, encoder_outputs)
-            # weighted = [batch size, 1, enc hid dim * direction]
-            all_attention.append(weighted)
+        attention_outputs = self.attention_layers.forward_all(out, encoder_outputs, mask, keys)
+        # attention_outputs = [batch size, decoder_inputs seq len, encoder_inputs len]
 
-        if attention_hidden_inputs.requires_grad:
-            attention_hidden_inputs.retain_grad()
-        all_attention = torch.cat(all_attention, dim=1)
+        all_attention = torch.bmm(attention_outputs, encoder_outputs)
         # all_attention = [batch size, decoder_inputs seq len, enc hid dim * direction]
 
         # linear forward
         out = self.linear(torch.cat([out, all_attention], dim=-1))
         return out, hidden
 
-    def decoder_forward_get_attention(self, decoder_inputs, hidden, encoder_outputs, mask):
+    def decode_step(self, token_ids, hidden, encoder_outputs, mask, keys=None, vocab=None):
+        # token_ids = [batch size], one token per sequence, so no padding or packing is needed
+        # hidden = [num layers, batch size, dec hid dim]
+        # encoder_outputs = [batch size, encoder_inputs len, enc hid dim * direction]
+        # mask = [batch size, encoder_inputs len]
+        # keys = [batch size, encoder_inputs len, dec hid dim], cached attention keys from encoder_forward
+        # vocab = LongTensor of the shortlisted target ids, output is restricted to them if given
+        if self.device == 'cuda':
+            token_ids = token_ids.cuda()
+
+        decoder_inputs = self.dst_embedding(token_ids.unsqueeze(1))
+        # decoder_inputs = [batch size, 1, emb dim]
+        out, hidden = self.decoder(decoder_inputs, hidden)
+        # out = [batch size, 1, dec hid dim]
+
+        attention_outputs = self.attention_layers.forward_all(out, encoder_outputs, mask, keys)
+        # attention_outputs = [batch size, 1, encoder_inputs len]
+        weighted = torch.bmm(attention_outputs, encoder_outputs)
+        # weighted = [batch size, 1, enc hid dim * direction]
+
+        out = self.project(torch.cat([out, weighted], dim=-1).squeeze(1), vocab)
+        # out = [batch size, output dim or len(vocab)]
+
+        return torch.log_softmax(out, dim=-1), hidden
+
+    def project(self, out, vocab=None):
+        # output projection, restricted to the rows of the shortlisted target ids if vocab is given
+        if vocab is None:
+            return self.linear(out)
+        if not isinstance(self.linear, nn.Linear):
+            # int8 dynamic quantized linear, its packed weight cannot be sliced
+            return self.linear(out).index_select(-1, vocab)
+        return F.linear(out, self.linear.weight.index_select(0, vocab), self.linear.bias.index_select(0, vocab))
+
+    def decoder_forward_get_attention(self, decoder_inputs, hidden, encoder_outputs, mask, keys=None):
         # decoder_inputs: list of tensor
         # hidden = [num layers, batch size, dec hid dim]
         # encoder_outputs = [batch size, encoder_inputs len, enc hid dim * direction]
         # mask = [batch size, encoder_inputs len]
+        # keys = [batch size, encoder_inputs len, dec hid dim], cached attention keys from encoder_forward
 
         # decoder_inputs = [i[:self.max_decoder_inputs_length] for i in decoder_inputs]
         if self.device == 'cuda':
@@ -272,20 +335,12 @@ class Seq2SeqAttentionModel(nn.Module):
                                                padding_value=self.dst_embedding.padding_idx)
         # out = [batch size, decoder_inputs seq len, dec hid dim]
 
-        all_attention = []
-        attention_hidden_inputs = out.permute(1, 0, 2)
-        all_attention_softmax = []
-        for i in range(len(attention_hidden_inputs)):
-            attention_hidden_input = attention_hidden_inputs[i]
-            attention_outputs = self.attention_layers(attention_hidden_input, encoder_outputs, mask).unsqueeze(1)
-            all_attention_softmax.append(attention_outputs)
-            # attention_outputs = [batch size, 1, encoder_inputs len]
-
-            weighted = torch.bmm(attention_outputs, encoder_outputs)
-            # weighted = [batch size, 1, enc hid dim * direction]
-            all_attention.append(weighted)
+        attention_outputs = self.attention_layers.forward_all(out, encoder_outputs, mask, keys)
+        # attention_outputs = [batch size, decoder_inputs seq len, encoder_inputs len]
+        all_attention_softmax = list(attention_outputs.split(1, dim=1))
+        # all_attention_softmax = list of [batch size, 1, encoder_inputs len], one per decoder step
 
-        all_attention = torch.cat(all_attention, dim=1)
+        all_attention = torch.bmm(attention_outputs, encoder_outputs)
         # all_attention = [batch size, decoder_inputs seq len, enc hid dim * direction]
 
         # linear forward
@@ -293,14 +348,14 @@ class Seq2SeqAttentionModel(nn.Module):
         return out, hidden, all_attention_softmax
 
     def forward_and_get_attention(self, x: List[torch.LongTensor], y: List[torch.LongTensor]):
-        encoder_outputs, hidden, mask = self.encoder_forward(x)
+        encoder_outputs, hidden, mask, keys = self.encoder_forward(x)
 
         for i in range(len(y)):
             if len(y[i]) > self.max_decoder_inputs_length:
                 y[i] = torch.cat([y[i][:self.max_decoder_inputs_length], torch.LongTensor([self.eos_idx])])
         decoder_inputs = [sent[:-1] for sent in y]
         decoder_outputs, hidden, attention_softmax = self.decoder_forward_get_attention(decoder_inputs, hidden,
-                                                                                        encoder_outputs, mask)
+                                                                                        encoder_outputs, mask, keys)
 
         return torch.topk(self.softmax(decoder_outputs), dim=-1, k=1), attention_softmax
 
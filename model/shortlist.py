@@ -0,0 +1,68 @@
+import json
+from collections import Counter
+
+import torch
+
+
+class Shortlist:
+    def __init__(self, lexical_table: dict, frequent_ids: list):
+        """
+        candidate target vocabulary of a request, used to restrict the output projection while decoding
+        :param lexical_table: source id -> list of target ids it is likely translated to
+        :param frequent_ids: target ids always kept, the most frequent target tokens and special tokens
+        """
+        self.lexical_table = lexical_table
+        self.frequent_ids = frequent_ids
+
+    @classmethod
+    def build(cls, src_sents, dst_sents, num_frequent=2000, top_k=20, special_ids=(0, 1, 2, 3)):
+        """
+        build a shortlist from a tokenized parallel corpus, translations of a source token are the
+        target tokens with the highest dice coefficient 2 * c(s, t) / (c(s) + c(t)) over sentence pairs
+        :param src_sents: list of source id tensor
+        :param dst_sents: list of target id tensor, aligned with src_sents
+        :param num_frequent: number of most frequent target tokens always kept
+        :param top_k: number of translations kept for each source token
+        :param special_ids: target ids always kept (bos, pad, eos, unk)
+        :return:
+        """
+        src_count, dst_count, pair_count = Counter(), Counter(), Counter()
+        dst_freq = Counter()
+        for src, dst in zip(src_sents, dst_sents):
+            src, dst = set(src.tolist()), dst.tolist()
+            dst_freq.update(dst)
+            dst = set(dst)
+            src_count.update(src)
+            dst_count.update(dst)
+            pair_count.update((s, t) for s in src for t in dst)
+
+        frequent_ids = list(special_ids) + [t for t, _ in dst_freq.most_common(num_frequent)]
+        frequent = set(frequent_ids)
+
+        translations = {}
+        for (s, t), c in pair_count.items():
+            if t in frequent:
+                continue
+            translations.setdefault(s, []).append((2 * c / (src_count[s] + dst_count[t]), t))
+        lexical_table = {s: [t for _, t in sorted(cands, reverse=True)[:top_k]] for s, cands in translations.items()}
+
+        return cls(lexical_table, sorted(frequent))
+
+    def candidates(self, x):
+        """
+        :param x: list of source tensor of a request
+        :return: sorted LongTensor of the candidate target ids
+        """
+        ids = set(self.frequent_ids)
+        for s in set(torch.cat(x).tolist()):
+            ids.update(self.lexical_table.get(s, []))
+        return torch.LongTensor(sorted(ids))
+
+    def save(self, path):
+        json.dump({'lexical_table': self.lexical_table, 'frequent_ids': self.frequent_ids},
+                  open(path, 'w', encoding='utf8'))
+
+    @classmethod
+    def load(cls, path):
+        obj = json.load(open(path, encoding='utf8'))
+        return cls({int(s): t for s, t in obj['lexical_table'].items()}, obj['frequent_ids'])
@@ -0,0 +1,132 @@
+import hashlib
+import inspect
+from argparse import Namespace
+from typing import List
+
+import numpy as np
+import torch
+
+from torch import nn
+
+from model.base_seq2seq import Seq2SeqModel
+from model.seq2seq_attention import Seq2SeqAttentionModel
+from tokenizer.BPE import BPE_EN, BPE_VI
+from tokenizer._tokenizer import Tokenizer
+from tokenizer.rdr_segmenter import RDRSegmenter
+from tokenizer.vocab import CompiledVocab, compile_vocab_bytes
+
+# Single file bundle of a trained model for inference: config, vocabularies of both tokenizers, BPE symbols
+# and the state dict (embeddings included). Loading it needs torch and numpy only, not gensim, sklearn, tqdm
+# or the json vocabulary / embedding files.
+# Vocabularies and symbols are stored as compiled vocabularies (tokenizer.vocab) in uint8 tensors, used in place
+# once loaded. With torch >= 2.1 the file is memory-mapped and, on cpu, the model uses its tensors without copy
+# (embeddings built on them, load_state_dict(assign=True)): pages are read when used and shared between processes.
+
+FORMAT_VERSION = 2
+MODELS = {'Seq2SeqModel': Seq2SeqModel, 'Seq2SeqAttentionModel': Seq2SeqAttentionModel}
+_mmap = {'mmap': True} if 'mmap' in inspect.signature(torch.load).parameters else {}
+_assign = {'assign': True} if 'assign' in inspect.signature(nn.Module.load_state_dict).parameters else {}
+
+
+def _config_dict(config):
+    return {key: getattr(config, key) for key in dir(config)
+            if not key.startswith('_') and isinstance(getattr(config, key), (bool, int, float, str))}
+
+
+def _tokenizer_dict(tokenizer: Tokenizer):
+    if tokenizer.vnSegment is None:
+        preprocess = False
+    elif isinstance(tokenizer.vnSegment, RDRSegmenter):
+        preprocess = 'rdr'
+    else:
+        preprocess = True
+    return {'lang': 'en' if isinstance(tokenizer.tokenizer, BPE_EN) else 'vi',
+            'vocab': _vocab_tensor(tokenizer.vocab),
+            'symbols': _vocab_tensor(tokenizer.tokenizer.symbols),
+            'preprocess': preprocess}
+
+
+def _vocab_tensor(vocab):
+    return torch.from_numpy(np.frombuffer(compile_vocab_bytes(dict(vocab.items())), dtype=np.uint8).copy())
+
+
+def _build_tokenizer(tokenizer_dict):
+    bpe_class = BPE_EN if tokenizer_dict['lang'] == 'en' else BPE_VI
+    bpe = bpe_class(padding=False, symbols=CompiledVocab(tokenizer_dict['symbols'].numpy()))
+    return Tokenizer(CompiledVocab(tokenizer_dict['vocab'].numpy()), bpe, preprocess=tokenizer_dict['preprocess'])
+
+
+def _sha1(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def save_bundle(path, model, src_tokenizer: Tokenizer, dst_tokenizer: Tokenizer, config):
+    """
+    :param model: Seq2SeqModel or Seq2SeqAttentionModel (not quantized, see load_bundle)
+    :param src_tokenizer: BPE Tokenizer of the source language
+    :param dst_tokenizer: BPE Tokenizer of the target language
+    :param config: config.Config the model was built with
+    """
+    state_dict = {key: value.cpu() for key, value in model.state_dict().items()}
+    torch.save({'format_version': FORMAT_VERSION,
+                'model': type(model).__name__,
+                'config': _config_dict(config),
+                'state_dict': state_dict,
+                'src': _tokenizer_dict(src_tokenizer),
+                'dst': _tokenizer_dict(dst_tokenizer)}, path)
+
+
+def load_bundle(path, device='cpu'):
+    """
+    :return: Translator of the bundle, its checksum is the sha1 of the file
+    """
+    bundle = torch.load(path, map_location=device, **_mmap)
+    assert bundle['format_version'] == FORMAT_VERSION, 'unsupported bundle format {}'.format(
+        bundle['format_version'])
+
+    config = Namespace(**bundle['config'])
+    config.device = device
+    state_dict = bundle['state_dict']
+    # the embeddings are the bundle tensors themselves, the other weights replace the random ones if
+    # load_state_dict can assign them, else they are copied into them
+    src_embedding = nn.Embedding.from_pretrained(state_dict['src_embedding.weight'], freeze=True,
+                                                 padding_idx=config.pad_idx)
+    dst_embedding = nn.Embedding.from_pretrained(state_dict['dst_embedding.weight'], freeze=True,
+                                                 padding_idx=config.pad_idx)
+    model = MODELS[bundle['model']](src_embedding, dst_embedding, config)
+    model.load_state_dict(state_dict, **_assign)
+    model.to(device)
+    model.eval()
+
+    return Translator(model, _build_tokenizer(bundle['src']), _build_tokenizer(bundle['dst']),
+                      checksum=_sha1(path))
+
+
+class Translator:
+    def __init__(self, model, src_tokenizer: Tokenizer, dst_tokenizer: Tokenizer, checksum=''):
+        """
+        text to text translation with a model and its tokenizers
+        :param checksum: identifies the model weights, see serving.cache
+        """
+        self.model = model
+        self.src_tokenizer = src_tokenizer
+        self.dst_tokenizer = dst_tokenizer
+        self.checksum = checksum
+
+    def translate(self, sents: List[str], max_len=50, beam_size=5, **kwargs):
+        """
+        :param sents: list of source sentence
+        :param kwargs: other arguments of model.predict (length_penalty, max_len_ratio, ...)
+        :return: list of translated sentence
+        """
+        if len(sents) == 0:
+            return []
+        ids, offsets = self.src_tokenizer.encode(sents)
+        ids = torch.from_numpy(ids)
+        x = [ids[offsets[i]: offsets[i + 1]] for i in range(len(sents))]
+        outputs = self.model.predict(x, max_len=max_len, beam_size=beam_size, **kwargs)
+        return self.dst_tokenizer.merge(outputs)
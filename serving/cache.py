@@ -0,0 +1,134 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Cache of translations in front of the model: an LRU in memory and an optional SQLite file kept across restarts.
+# A key is the normalized source sentence with everything that changes the output: decoding parameters and the
+# checksum of the model (serving.bundle.Translator.checksum).
+
+
+def normalize(sent: str):
+    """
+    NFC unicode and single spaces, so sentences differing only by those share an entry
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', sent)).strip()
+
+
+class TranslationCache:
+    def __init__(self, max_size=100000, db_path=None):
+        """
+        :param max_size: max number of translations in memory, least recently used ones are dropped
+        :param db_path: SQLite file of the on-disk tier, no disk tier if None
+        """
+        self.max_size = max_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+        if db_path is not None:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, translation TEXT)')
+            self.db.commit()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(sent, checksum='', **params):
+        """
+        :param params: decoding parameters, beam_size, max_len, ...
+        """
+        params = ','.join('{}={}'.format(name, params[name]) for name in sorted(params))
+        return hashlib.sha1('{}\t{}\t{}'.format(checksum, params, normalize(sent)).encode('utf8')).hexdigest()
+
+    def get(self, key):
+        """
+        :return: the cached translation or None
+        """
+        with self.lock:
+            translation = self.memory.get(key)
+            if translation is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return translation
+            if self.db is not None:
+                row = self.db.execute('SELECT translation FROM translations WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self._put_memory(key, row[0])
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, translation):
+        self.put_many([(key, translation)])
+
+    def put_many(self, items):
+        """
+        :param items: list of (key, translation)
+        """
+        with self.lock:
+            for key, translation in items:
+                self._put_memory(key, translation)
+            if self.db is not None:
+                self.db.executemany('INSERT OR REPLACE INTO translations VALUES (?, ?)', items)
+                self.db.commit()
+
+    def lookup(self, sents, checksum='', **params):
+        """
+        :return: (res, todo), res is the cached translation of each sentence or None, todo is the key -> positions
+                 in sents of the sentences to translate, repeated ones once. See fill
+        """
+        keys = [self.key(sent, checksum, **params) for sent in sents]
+        res = [self.get(key) for key in keys]
+        todo = OrderedDict()
+        for i, translation in enumerate(res):
+            if translation is None:
+                todo.setdefault(keys[i], []).append(i)
+        return res, todo
+
+    def fill(self, res, todo, translations):
+        """
+        put the translations of the todo sentences of lookup in res and in the cache
+        :param translations: list of translation, one per todo entry
+        """
+        for positions, translation in zip(todo.values(), translations):
+            for i in positions:
+                res[i] = translation
+        self.put_many(list(zip(todo, translations)))
+
+    def _put_memory(self, key, translation):
+        self.memory[key] = translation
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.disk_hits + self.misses
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self.memory),
+                'max_size': self.max_size,
+                'hit_rate': (self.hits + self.disk_hits) / total if total else 0.0}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+
+
+class CachedTranslator:
+    def __init__(self, translator, cache: TranslationCache):
+        """
+        translator whose cached sentences skip the model, same translate as serving.bundle.Translator
+        """
+        self.translator = translator
+        self.cache = cache
+        self.checksum = getattr(translator, 'checksum', '')
+
+    def translate(self, sents, max_len=50, beam_size=5, **kwargs):
+        res, todo = self.cache.lookup(sents, self.checksum, max_len=max_len, beam_size=beam_size, **kwargs)
+        if todo:
+            translations = self.translator.translate([sents[positions[0]] for positions in todo.values()],
+                                                     max_len, beam_size, **kwargs)
+            self.cache.fill(res, todo, translations)
+        return res
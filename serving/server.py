@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# asyncio HTTP/JSON translation service, stdlib only.
+# Sentences of concurrent requests are queued and decoded together in micro-batches, a batch is sent to the model
+# when it is full or when its oldest sentence has waited max_latency seconds.
+#
+#   POST /translate {"sentences": ["...", ...]} -> {"translations": ["...", ...]}
+#   GET /health -> {"status": "ok", "queue": n, ..., "cache": hit rate metrics if there is a cache}
+#
+# 503 is returned when the queue is full.
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MicroBatcher:
+    def __init__(self, translator, max_batch_size=32, max_latency=0.01, max_queue_size=1024, max_len=50,
+                 beam_size=5, cache=None):
+        """
+        :param translator: object with translate(sents, max_len, beam_size) -> list of str, serving.bundle.Translator
+        :param max_batch_size: max number of sentences decoded together
+        :param max_latency: max seconds the first sentence of a batch waits for the batch to fill
+        :param max_queue_size: max number of waiting sentences, more are refused with QueueFull
+        :param cache: serving.cache.TranslationCache, cached sentences are answered without being queued
+        """
+        self.translator = translator
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.max_queue_size = max_queue_size
+        self.max_len = max_len
+        self.beam_size = beam_size
+        self.cache = cache
+        self.checksum = getattr(translator, 'checksum', '')
+        self.queue = None
+        # decoding runs off the event loop, one batch at a time
+        self.executor = ThreadPoolExecutor(1)
+        # cache lookups may read the SQLite file, they must not block the event loop nor wait for a batch
+        self.cache_executor = ThreadPoolExecutor(1) if cache is not None else None
+        self.task = None
+        self.num_batches = 0
+        self.num_sentences = 0
+
+    def start(self):
+        self.queue = asyncio.Queue(self.max_queue_size)
+        self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown()
+        if self.cache_executor is not None:
+            self.cache_executor.shutdown()
+
+    async def translate(self, sents):
+        """
+        :return: the translations of sents, decoded with the sentences of other requests
+        :raise QueueFull: if the queue has no room for the sentences to decode
+        """
+        if self.cache is None:
+            return await self._translate(sents)
+        # same steps as serving.cache.CachedTranslator, with the model call replaced by the queue
+        loop = asyncio.get_event_loop()
+        res, todo = await loop.run_in_executor(self.cache_executor, functools.partial(
+            self.cache.lookup, sents, self.checksum, max_len=self.max_len, beam_size=self.beam_size))
+        if todo:
+            translations = await self._translate([sents[positions[0]] for positions in todo.values()])
+            await loop.run_in_executor(self.cache_executor, self.cache.fill, res, todo, translations)
+        return res
+
+    async def _translate(self, sents):
+        if self.queue.qsize() + len(sents) > self.max_queue_size:
+            raise QueueFull()
+        loop = asyncio.get_event_loop()
+        futures = []
+        for sent in sents:
+            future = loop.create_future()
+            self.queue.put_nowait((sent, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._next_batch()
+            sents = [sent for sent, _ in batch]
+            try:
+                translations = await loop.run_in_executor(self.executor, self.translator.translate, sents,
+                                                          self.max_len, self.beam_size)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.num_batches += 1
+            self.num_sentences += len(batch)
+            for (_, future), translation in zip(batch, translations):
+                if not future.done():
+                    future.set_result(translation)
+
+
+class TranslationServer:
+    def __init__(self, batcher: MicroBatcher, host='127.0.0.1', port=8000):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self._route(method, path, body)
+                data = json.dumps(response, ensure_ascii=False).encode('utf8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write('HTTP/1.1 {}\r\nContent-Type: application/json; charset=utf-8\r\n'
+                             'Content-Length: {}\r\nConnection: {}\r\n\r\n'
+                             .format(status, len(data), 'keep-alive' if keep_alive else 'close').encode('latin-1'))
+                writer.write(data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            response = {'status': 'ok', 'queue': self.batcher.queue.qsize(), 'batches': self.batcher.num_batches,
+                        'sentences': self.batcher.num_sentences}
+            if self.batcher.cache is not None:
+                response['cache'] = self.batcher.cache.stats()
+            return '200 OK', response
+        if method != 'POST' or path != '/translate':
+            return '404 Not Found', {'error': 'not found'}
+        try:
+            sents = json.loads(body.decode('utf8'))['sentences']
+            if not isinstance(sents, list) or not all(isinstance(sent, str) for sent in sents):
+                raise ValueError()
+        except (ValueError, KeyError, TypeError):
+            return '400 Bad Request', {'error': 'expected {"sentences": [str, ...]}'}
+        try:
+            translations = await self.batcher.translate(sents)
+        except QueueFull:
+            return '503 Service Unavailable', {'error': 'queue full'}
+        except Exception as e:
+            return '500 Internal Server Error', {'error': str(e)}
+        return '200 OK', {'translations': translations}
+
+
+async def translate_client(sents, host='127.0.0.1', port=8000):
+    """
+    stub client, one POST /translate on a new connection
+    :return: (HTTP status code, json response)
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps({'sentences': sents}, ensure_ascii=False).encode('utf8')
+    writer.write('POST /translate HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                 'Connection: close\r\n\r\n'.format(host, len(body)).encode('latin-1'))
+    writer.write(body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, value = line.decode('latin-1').split(':', 1)
+        if key.strip().lower() == 'content-length':
+            length = int(value)
+    response = json.loads((await reader.readexactly(length)).decode('utf8'))
+    writer.close()
+    return status, response
+
+
+class StubTranslator:
+    def __init__(self, delay=0.0):
+        """
+        model-free translator for local tests of the server, upper cases the sentences
+        :param delay: seconds per batch, as a model would take
+        """
+        self.delay = delay
+        self.batch_sizes = []
+
+    def translate(self, sents, max_len=50, beam_size=5):
+        self.batch_sizes.append(len(sents))
+        time.sleep(self.delay)
+        return [sent.upper() for sent in sents]
+
+
+async def _demo(num_requests=100):
+    translator = StubTranslator(delay=0.02)
+    server = TranslationServer(MicroBatcher(translator), port=0)
+    await server.start()
+    results = await asyncio.gather(*[translate_client(['sentence {}'.format(i)], port=server.port)
+                                     for i in range(num_requests)])
+    await server.stop()
+    assert all(status == 200 and response['translations'] == ['SENTENCE {}'.format(i)]
+               for i, (status, response) in enumerate(results))
+    print('{} requests in {} batches'.format(num_requests, len(translator.batch_sizes)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bundle', help='file written by serving.bundle.save_bundle, the stub translator if not set')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max_batch_size', type=int, default=32)
+    parser.add_argument('--max_latency', type=float, default=0.01)
+    parser.add_argument('--max_queue_size', type=int, default=1024)
+    parser.add_argument('--max_len', type=int, default=50)
+    parser.add_argument('--beam_size', type=int, default=5)
+    parser.add_argument('--cache_size', type=int, default=0, help='number of translations cached in memory')
+    parser.add_argument('--cache_db', help='SQLite file of the cache kept across restarts')
+    parser.add_argument('--demo', action='store_true', help='run the stub client against a stub server and exit')
+    args = parser.parse_args()
+
+    if args.demo:
+        asyncio.run(_demo())
+    else:
+        if args.bundle:
+            from serving.bundle import load_bundle
+            translator = load_bundle(args.bundle)
+        else:
+            translator = StubTranslator()
+        cache = None
+        if args.cache_size > 0 or args.cache_db:
+            from serving.cache import TranslationCache
+            cache = TranslationCache(args.cache_size, args.cache_db)
+        batcher = MicroBatcher(translator, args.max_batch_size, args.max_latency, args.max_queue_size, args.max_len,
+                               args.beam_size, cache)
+        asyncio.run(TranslationServer(batcher, args.host, args.port).serve_forever())
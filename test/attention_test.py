@@ -0,0 +1,76 @@
+import torch
+import torch.nn.functional as F
+
+from torch.nn.utils.rnn import pad_sequence, pack_padded_sequence, pad_packed_sequence
+
+from config import config
+from helpers import small_model, random_batch
+from model.seq2seq_attention import Seq2SeqAttentionModel
+
+# The vectorized attention of decoder_forward against the per-step loop it replaced, in float64
+
+
+def attention_step(attention, hidden, encoder_outputs, mask):
+    # Attention.forward before vectorization: one decoder step, attn over cat(hidden, encoder_outputs)
+    attn_weight = torch.cat([attention.attn_query.weight, attention.attn_keys.weight], dim=1)
+    hidden = hidden.unsqueeze(1).repeat(1, encoder_outputs.shape[1], 1)
+    energy = torch.tanh(F.linear(torch.cat((hidden, encoder_outputs), dim=2), attn_weight, attention.attn_keys.bias))
+    scores = attention.v(energy).squeeze(2).masked_fill(mask == 0, -1e10)
+    return F.softmax(scores, dim=1)
+
+
+def decoder_forward_loop(model, decoder_inputs, hidden, encoder_outputs, mask):
+    # Seq2SeqAttentionModel.decoder_forward before vectorization
+    lens = [len(sent) for sent in decoder_inputs]
+    decoder_inputs = pad_sequence(decoder_inputs, batch_first=True, padding_value=model.dst_embedding.padding_idx)
+    decoder_inputs = pack_padded_sequence(model.dst_embedding(decoder_inputs), lens, batch_first=True,
+                                          enforce_sorted=False)
+    out_packed, hidden = model.decoder(decoder_inputs, hidden)
+    out, _ = pad_packed_sequence(out_packed, batch_first=True, padding_value=model.dst_embedding.padding_idx)
+    all_attention = []
+    for step in out.permute(1, 0, 2):
+        weights = attention_step(model.attention_layers, step, encoder_outputs, mask).unsqueeze(1)
+        all_attention.append(torch.bmm(weights, encoder_outputs))
+    all_attention = torch.cat(all_attention, dim=1)
+    return model.linear(torch.cat([out, all_attention], dim=-1)), hidden
+
+
+def test_decoder_forward_matches_loop():
+    model = small_model(Seq2SeqAttentionModel, seed=3)
+    with torch.no_grad():
+        for seed in range(5):
+            x, y = random_batch(2 * seed), random_batch(2 * seed + 1)
+            encoder_outputs, hidden, mask, keys = model.encoder_forward(x)
+            out, (h, c) = model.decoder_forward(y, hidden, encoder_outputs, mask, keys)
+            out_loop, (h_loop, c_loop) = decoder_forward_loop(model, y, hidden, encoder_outputs, mask)
+            assert (out - out_loop).abs().max() < 1e-9
+            assert (h - h_loop).abs().max() < 1e-9 and (c - c_loop).abs().max() < 1e-9
+
+
+def test_attention_weights_match_loop():
+    model = small_model(Seq2SeqAttentionModel, seed=3)
+    with torch.no_grad():
+        x, y = random_batch(0), random_batch(1)
+        encoder_outputs, hidden, mask, keys = model.encoder_forward(x)
+        _, _, weights = model.decoder_forward_get_attention(y, hidden, encoder_outputs, mask, keys)
+        lens = [len(sent) for sent in y]
+        decoder_inputs = pack_padded_sequence(
+            model.dst_embedding(pad_sequence(y, batch_first=True, padding_value=config.pad_idx)), lens,
+            batch_first=True, enforce_sorted=False)
+        steps, _ = pad_packed_sequence(model.decoder(decoder_inputs, hidden)[0], batch_first=True,
+                                       padding_value=config.pad_idx)
+        for i, step in enumerate(steps.permute(1, 0, 2)):
+            expected = attention_step(model.attention_layers, step, encoder_outputs, mask)
+            assert (weights[i].squeeze(1) - expected).abs().max() < 1e-9
+
+
+def test_decode_step_matches_loop():
+    model = small_model(Seq2SeqAttentionModel, seed=3)
+    with torch.no_grad():
+        x = random_batch()
+        encoder_outputs, hidden, mask, keys = model.encoder_forward(x)
+        token_ids = torch.randint(4, 40, (len(x),))
+        log_prob, _ = model.decode_step(token_ids, hidden, encoder_outputs, mask, keys)
+        out_loop, _ = decoder_forward_loop(model, list(token_ids.unsqueeze(1)), hidden, encoder_outputs, mask)
+        assert (log_prob - torch.log_softmax(out_loop.squeeze(1), dim=-1)).abs().max() < 1e-9
+
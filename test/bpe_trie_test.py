@@ -0,0 +1,73 @@
+import random
+
+from tokenizer.BPE import BPE_EN, BPE_VI
+from tokenizer._tokenizer import Tokenizer
+
+# Trie segmentation of BPE_EN / BPE_VI against the substring loops it replaced, compared as IDs
+
+
+def segment_en_loop(symbols, token):
+    # BPE_EN.segment_BPE before the trie, for one word
+    start, end = 0, len(token)
+    cur_output = []
+    while start < len(token) and start < end:
+        if token[start: end] in symbols:
+            cur_output.append(token[start: end])
+            start = end
+            end = len(token)
+        else:
+            end -= 1
+    if start < len(token):
+        cur_output.append('<unk>')
+    return cur_output
+
+
+def segment_vi_loop(symbols, token):
+    # BPE_VI.segment_BPE before the trie, for one word
+    start, end = 0, len(token)
+    cur_output = []
+    while start < len(token) and start < end:
+        if end == len(token) and token[start:end] in symbols:
+            cur_output.append(token[start:end])
+            start = end
+            break
+        elif end < len(token) and token[start:end] + '@@' in symbols:
+            cur_output.append(token[start: end] + '@@')
+            start = end
+            end = len(token)
+        else:
+            end -= 1
+    if start < len(token):
+        cur_output.append('<unk>')
+    return cur_output
+
+
+def random_sentences(symbols, num_sents=3000, seed=0):
+    # words glued from symbols and random characters, so that known, partly known and unknown pieces all occur
+    rng = random.Random(seed)
+    keys = sorted(symbols.keys())
+    chars = sorted(set(''.join(keys[:3000]))) + ['@', 'Ġ', '#']
+    sents = []
+    for _ in range(num_sents):
+        words = []
+        for _ in range(rng.randint(1, 15)):
+            word = ''.join(rng.choice(keys) if rng.random() < 0.6 else
+                           ''.join(rng.choice(chars) for _ in range(rng.randint(1, 3)))
+                           for _ in range(rng.randint(1, 4)))
+            words.append(''.join(word.split()))
+        sents.append(' '.join(words))
+    return sents
+
+
+SEGMENT_LOOPS = {BPE_EN: segment_en_loop, BPE_VI: segment_vi_loop}
+
+
+def test_trie_matches_loop(bpe):
+    segment_loop = SEGMENT_LOOPS[type(bpe)]
+    tokenizer = Tokenizer(bpe.symbols, bpe)
+    sents = random_sentences(bpe.symbols)
+    ids, offsets = tokenizer.encode(sents)
+    for i, sent in enumerate(sents):
+        expected = [tokenizer.vocab.get(piece, tokenizer.unk) for word in bpe._words(sent)
+                    for piece in segment_loop(bpe.symbols, word)]
+        assert ids[offsets[i]: offsets[i + 1]].tolist() == expected, sent
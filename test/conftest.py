@@ -0,0 +1,11 @@
+import pytest
+
+from tokenizer.BPE import BPE_EN, BPE_VI
+
+
+@pytest.fixture(scope='session', params=[BPE_EN, BPE_VI], ids=['en', 'vi'])
+def bpe(request):
+    """
+    BPE_EN then BPE_VI from tokenizer/resources, built once for all the tests using them
+    """
+    return request.param(padding=False)
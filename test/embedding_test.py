@@ -0,0 +1,59 @@
+import numpy as np
+import torch
+
+from helpers import small_config, random_batch
+from model.embedding import mmap_embedding, save_checkpoint, load_checkpoint
+from model.seq2seq_attention import Seq2SeqAttentionModel
+
+# Checkpoints of models whose embeddings are memory-mapped pretrained vectors
+
+
+def mapped_model(tmp_path, seed=0):
+    # same pretrained vectors for every model of a test, the other weights depend on seed
+    for i, name in enumerate(['src', 'dst']):
+        if not (tmp_path / (name + '.npy')).exists():
+            np.save(str(tmp_path / (name + '.npy')), np.random.RandomState(i).rand(40, 12).astype(np.float32))
+    torch.manual_seed(seed)
+    model = Seq2SeqAttentionModel(mmap_embedding(np.load(str(tmp_path / 'src.npy'), mmap_mode='c')),
+                                  mmap_embedding(np.load(str(tmp_path / 'dst.npy'), mmap_mode='c')), small_config())
+    return model.eval()
+
+
+def test_init_weights_keeps_pretrained_vectors(tmp_path):
+    model = mapped_model(tmp_path)
+    model.init_weights()
+    assert np.array_equal(model.src_embedding.weight.numpy(), np.load(str(tmp_path / 'src.npy')))
+    model.init_weights(init_frozen=True)
+    assert not np.array_equal(model.src_embedding.weight.numpy(), np.load(str(tmp_path / 'src.npy')))
+
+
+def test_checkpoint_keeps_mapped_embeddings(tmp_path):
+    model = mapped_model(tmp_path, seed=1)
+    save_checkpoint(model, str(tmp_path / 'model.pt'))
+    assert 'src_embedding.weight' not in torch.load(str(tmp_path / 'model.pt'))
+    torch.save(model.state_dict(), str(tmp_path / 'full.pt'))
+
+    for checkpoint in ['model.pt', 'full.pt']:
+        loaded = mapped_model(tmp_path, seed=2)
+        pointer = loaded.src_embedding.weight.data_ptr()
+        load_checkpoint(loaded, str(tmp_path / checkpoint))
+        assert loaded.src_embedding.weight.data_ptr() == pointer
+        for key, value in model.state_dict().items():
+            assert torch.equal(loaded.state_dict()[key], value), key
+
+
+def test_checkpoint_with_other_embeddings(tmp_path):
+    # trained when init_weights replaced the pretrained vectors by random ones
+    model = mapped_model(tmp_path, seed=1)
+    model.init_weights(init_frozen=True)
+    torch.save(model.state_dict(), str(tmp_path / 'old.pt'))
+
+    loaded = mapped_model(tmp_path, seed=2)
+    mapped = loaded.src_embedding.weight
+    load_checkpoint(loaded, str(tmp_path / 'old.pt'))
+    for key, value in model.state_dict().items():
+        assert torch.equal(loaded.state_dict()[key], value), key
+    # replaced, the mapped vectors are not written
+    assert torch.equal(mapped, torch.from_numpy(np.load(str(tmp_path / 'src.npy'))))
+    x = random_batch()
+    assert model.predict(x, max_len=8, beam_size=2) == loaded.predict(x, max_len=8, beam_size=2)
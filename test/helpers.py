@@ -0,0 +1,39 @@
+from argparse import Namespace
+
+import torch
+
+from torch import nn
+
+from config import config
+
+# Small random models and batches shared by the model tests
+
+
+def small_config(lstm_dim=8):
+    """
+    copy of config.config with a small lstm, on cpu
+    """
+    copy = Namespace(**{key: getattr(config, key) for key in dir(config) if not key.startswith('_')})
+    copy.lstm_dim = lstm_dim
+    copy.device = 'cpu'
+    return copy
+
+
+def small_model(model_class, seed=0, vocab_size=40, embedding_dim=12, lstm_dim=8):
+    """
+    :param model_class: Seq2SeqModel or Seq2SeqAttentionModel
+    :return: randomly initialized float64 model in eval mode
+    """
+    torch.manual_seed(seed)
+    model = model_class(nn.Embedding(vocab_size, embedding_dim, padding_idx=config.pad_idx),
+                        nn.Embedding(vocab_size, embedding_dim, padding_idx=config.pad_idx), small_config(lstm_dim))
+    return model.double().eval()
+
+
+def random_batch(seed=0, vocab_size=40, batch_size=6, max_len=9):
+    """
+    :return: list of batch_size LongTensor of 1 to max_len IDs, special IDs excluded
+    """
+    generator = torch.Generator().manual_seed(seed)
+    return [torch.randint(4, vocab_size, (int(torch.randint(1, max_len + 1, (), generator=generator)),),
+                          generator=generator) for _ in range(batch_size)]
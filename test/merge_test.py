@@ -0,0 +1,39 @@
+import random
+
+import numpy as np
+
+from tokenizer._tokenizer import Tokenizer
+
+# Table merge (Tokenizer.merge through merge_ids) against the regex merge of id2sent, on model-like outputs
+
+
+def random_outputs(tokenizer, num_sents=3000, seed=0):
+    # <s>, sub words, </s> unless cut by max_len, as predict gives
+    rng = random.Random(seed)
+    num_ids = max(tokenizer.index2word) + 1
+    outputs = []
+    for _ in range(num_sents):
+        ids = [tokenizer.bos] if rng.random() < 0.9 else []
+        ids += [rng.randrange(4, num_ids) for _ in range(rng.randint(0, 20))]
+        if rng.random() < 0.8:
+            ids.append(tokenizer.eos)
+        outputs.append(np.array(ids, dtype=np.int64))
+    return outputs
+
+
+def test_table_merge_matches_regex(bpe):
+    tokenizer = Tokenizer(bpe.symbols, bpe)
+    outputs = random_outputs(tokenizer)
+    # encoded sentences, merged back
+    sents = ['But lets face it: At the core of this line of thinking isnt safety -- its sex',
+             'Cuối cùng thì ta cũng không thể win the champion', 'a  b ', '']
+    ids, offsets = tokenizer.encode(sents)
+    outputs += [ids[offsets[i]: offsets[i + 1]] for i in range(len(sents))]
+
+    merged = tokenizer.merge(outputs)
+    expected = bpe.merge(tokenizer.id2sent(outputs))
+    for ids, sent, expected_sent in zip(outputs, merged, expected):
+        if sent != expected_sent:
+            # the regexes leave a stray <s> or </s> when there is no sub word, the table gives ''
+            assert sent == '' and expected_sent in ('<s>', '</s>'), (ids.tolist(), sent, expected_sent)
+
@@ -0,0 +1,43 @@
+import torch
+
+from config import config
+from helpers import small_model, random_batch
+from model.base_seq2seq import Seq2SeqModel
+from model.seq2seq_attention import Seq2SeqAttentionModel
+
+# Batched beam search (finished sentences leave the batch early) against one predict call per sentence
+
+
+def finishing_model(model_class):
+    model = small_model(model_class, seed=5)
+    # a random model emits </s> at the first step or never, raise its bias until the sentences of a batch
+    # finish at different steps, so that finished sentences leave the batch
+    x = random_batch(7, batch_size=12, max_len=15)
+    with torch.no_grad():
+        for _ in range(100):
+            lengths = [len(output) for output in model.predict(x, max_len=20, beam_size=3)]
+            if len(set(lengths)) > 2:
+                return model
+            model.linear.bias[config.eos_idx] += 0.02
+    raise AssertionError('no </s> bias gives sentences of different lengths')
+
+
+def check_predict(model):
+    x = random_batch(7, batch_size=12, max_len=15)
+    for kwargs in [{'max_len': 12, 'beam_size': 1},
+                   {'max_len': 12, 'beam_size': 4},
+                   {'max_len': 20, 'beam_size': 3, 'length_penalty': 0.6},
+                   {'max_len': 30, 'beam_size': 4, 'max_len_ratio': 1.0, 'max_len_offset': 2}]:
+        outputs = model.predict(x, **kwargs)
+        assert len(outputs) == len(x)
+        for sent, output in zip(x, outputs):
+            assert list(output) == list(model.predict([sent], **kwargs)[0]), kwargs
+
+
+def test_seq2seq_batched_predict_matches_single():
+    check_predict(finishing_model(Seq2SeqModel))
+
+
+def test_seq2seq_attention_batched_predict_matches_single():
+    check_predict(finishing_model(Seq2SeqAttentionModel))
+
@@ -0,0 +1,54 @@
+import multiprocessing
+import pickle
+
+from tokenizer.rdr_segmenter import RDRSegmenter, read_java_string_set, read_rdr_tree
+
+# Port of the VnCoreNLP RDRsegmenter, on the model files of tokenizer/models/wordsegmenter
+
+MODEL_DIR = './tokenizer/models/wordsegmenter'
+
+# VnCoreNLP segmentations not depending on its hard coded name lists
+SEGMENTED = {
+    'Ông Nguyễn Khắc Chúc đang làm việc tại Đại học Quốc gia Hà Nội.':
+        'Ông Nguyễn_Khắc_Chúc đang làm_việc tại Đại_học Quốc_gia Hà_Nội .',
+    'Tôi là sinh viên đại học quốc gia Hà Nội.': 'Tôi là sinh_viên đại_học quốc_gia Hà_Nội .',
+    'Chúng tôi đã đến thành phố Hồ Chí Minh vào năm 2019.':
+        'Chúng_tôi đã đến thành_phố Hồ_Chí_Minh vào năm 2019 .',
+    'Học sinh được nghỉ học ngày mai': 'Học_sinh được nghỉ học ngày_mai',
+}
+
+
+def test_model_files():
+    dictionary = read_java_string_set(MODEL_DIR + '/vi-vocab')
+    assert len(dictionary) > 30000 and {'sinh viên', 'đại học', 'làm việc'} <= dictionary
+    root = read_rdr_tree(MODEL_DIR + '/wordsegmenter.rdr')
+    assert root.depth == 0 and root.condition == ()
+    # one node per rule
+    num_nodes, nodes = 0, [root]
+    while nodes:
+        node = nodes.pop()
+        num_nodes += 1
+        assert all(child.depth == node.depth + 1 for child in node.children)
+        nodes.extend(node.children)
+    with open(MODEL_DIR + '/wordsegmenter.rdr', encoding='utf8') as f:
+        assert num_nodes == sum(1 for line in f if line.strip())
+
+
+def test_word_segment():
+    segmenter = RDRSegmenter(MODEL_DIR)
+    assert segmenter.word_segment_many(list(SEGMENTED)) == list(SEGMENTED.values())
+    assert segmenter.word_segment('') == ''
+
+
+def _segment(segmenter, inps):
+    return segmenter.word_segment_many(inps)
+
+
+def test_pickle_and_spawn():
+    segmenter = RDRSegmenter(MODEL_DIR, family_names=['nguyễn'])
+    copy = pickle.loads(pickle.dumps(segmenter))
+    assert copy.family_names == {'nguyễn'}
+    assert copy.word_segment_many(list(SEGMENTED)) == list(SEGMENTED.values())
+    # workers of the spawn start method receive the segmenter pickled
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        assert pool.apply(_segment, (segmenter, list(SEGMENTED))) == list(SEGMENTED.values())
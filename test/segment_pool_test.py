@@ -0,0 +1,47 @@
+import multiprocessing
+
+from tokenizer import preprocess
+
+
+class FakeSegmentNLP:
+    # stands for the VnCoreNLP annotator, java is not needed to check the pool
+    def __init__(self, jar_file=None):
+        pass
+
+    def word_segment_many(self, inps):
+        return [inp.replace(' ', '_') for inp in inps]
+
+    def close(self):
+        pass
+
+
+def _segment_in_child(pool, result):
+    result.put(pool.word_segment_many(['một hai', 'ba bốn', 'năm']))
+
+
+def test_segment_pool_after_fork():
+    vn_segment_nlp = preprocess.VnSegmentNLP
+    preprocess.VnSegmentNLP = FakeSegmentNLP
+    try:
+        pool = preprocess.SegmentPool(num_workers=2, cache_size=0, chunk_size=1)
+    finally:
+        preprocess.VnSegmentNLP = vn_segment_nlp
+    # the executor threads are started in the parent before the fork
+    assert pool.word_segment_many(['a b', 'c d', 'e']) == ['a_b', 'c_d', 'e']
+
+    ctx = multiprocessing.get_context('fork')
+    result = ctx.Queue()
+    child = ctx.Process(target=_segment_in_child, args=(pool, result))
+    child.start()
+    child.join(10)
+    if child.is_alive():
+        child.terminate()
+        raise AssertionError('word_segment_many hangs in a forked child')
+    assert child.exitcode == 0
+    assert result.get(timeout=1) == ['một_hai', 'ba_bốn', 'năm']
+    pool.close()
+
+
+if __name__ == '__main__':
+    test_segment_pool_after_fork()
+    print('ok')
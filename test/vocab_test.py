@@ -0,0 +1,52 @@
+import json
+import os
+import pickle
+
+from tokenizer import utils
+from tokenizer.vocab import CompiledVocab, compile_vocab, load_vocab
+
+# Compiled vocabularies: lookups, recompilation and rewriting a file other processes have mapped
+
+
+def test_compiled_vocab_lookups(tmp_path):
+    words = ['<s>', '<pad>', '</s>', '<unk>', 'một', 'hai', 'Ġthe', 'sinh_viên']
+    vocab = load_vocab(str(tmp_path / 'vocab'), words)
+    assert len(vocab) == len(words)
+    for i, word in enumerate(words):
+        assert vocab[word] == i and vocab.index2word[i] == word
+    assert vocab.get('ba') is None and 'ba' not in vocab
+    assert dict(pickle.loads(pickle.dumps(vocab)).items()) == dict(vocab.items())
+
+
+def test_load_vocab_recompiles_other_vocab(tmp_path):
+    path = str(tmp_path / 'vocab')
+    assert load_vocab(path, ['a', 'b'])['b'] == 1
+    vocab = load_vocab(path, ['a', 'c', 'b'])
+    assert vocab['c'] == 1 and vocab['b'] == 2
+
+
+def test_recompile_while_mapped(tmp_path):
+    # the old file stays readable by who has it mapped, rewriting it in place was a SIGBUS
+    path = str(tmp_path / 'vocab')
+    compile_vocab(['w{}'.format(i) for i in range(100000)], path)
+    old = CompiledVocab(path)
+    compile_vocab(['a'], path)
+    assert old.get('w99999') == 99999
+    assert CompiledVocab(path)['a'] == 0
+    assert os.listdir(str(tmp_path)) == ['vocab']
+
+
+def test_read_vocab_compiles_json(tmp_path):
+    vocab_file = str(tmp_path / 'vocab')
+    with open(vocab_file + '_en.json', 'w', encoding='utf8') as f:
+        json.dump({'a': 0, 'b': 1}, f)
+    vocab = utils.read_vocab(vocab_file, 'en')
+    assert isinstance(vocab, CompiledVocab) and vocab['b'] == 1
+    assert os.path.exists(vocab_file + '_en.vocab')
+
+    with open(vocab_file + '_en.json', 'w', encoding='utf8') as f:
+        json.dump({'a': 0, 'c': 1}, f)
+    mtime = os.path.getmtime(vocab_file + '_en.vocab') + 1
+    os.utime(vocab_file + '_en.json', (mtime, mtime))
+    vocab = utils.read_vocab(vocab_file, 'en')
+    assert vocab['c'] == 1 and 'b' not in vocab
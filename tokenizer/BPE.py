@@ -1,42 +1,134 @@
 import re
 
 from abc import ABC
+from collections import Counter, OrderedDict
 from typing import Union
-from tqdm import tqdm
 from tokenizer import utils
+from tokenizer.trie import Trie
+from tokenizer.parallel import imap_method
 
 
 class BPE(ABC):
     def __init__(self, vocab_file='./tokenizer/resources/vocab', decode_file='./tokenizer/resources/inv_vocab',
-                 max_length=256, padding=True, lang='vi'):
-        self.symbols = utils.read_vocab(vocab_file, lang)
-        self.decode = utils.read_decode(decode_file, lang)
+                 max_length=256, padding=True, lang='vi', cache_size=100000, symbols=None):
+        """
+        :param symbols: dict symbol -> ID or CompiledVocab, to build the tokenizer without reading vocab_file /
+                        decode_file
+        """
+        # self.decode is ID (int) -> symbol whatever the source
+        if symbols is not None:
+            self.symbols = symbols
+        else:
+            self.symbols = utils.read_vocab(vocab_file, lang)
+        if hasattr(self.symbols, 'index2word'):
+            # compiled vocabulary, ID -> symbol is served by the same file
+            self.decode = self.symbols.index2word
+        elif symbols is not None:
+            self.decode = {i: symbol for symbol, i in symbols.items()}
+        else:
+            self.decode = {int(i): symbol for i, symbol in utils.read_decode(decode_file, lang).items()}
+        # built on first segmentation, see trie
+        self._trie = None
         self.padding = padding
         if not padding:
             self.max_length = -1
         else:
             self.max_length = max_length
+        # LRU memo of _segment_pieces, keyed on the surface word
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def trie(self):
+        """
+        Trie of the symbols, a tokenizer only used to merge (target side) never builds it
+        """
+        if self._trie is None:
+            self._trie = Trie(self.symbols)
+        return self._trie
+
+    def _segment_pieces(self, token):
+        """
+        :param token: a word
+        :return: the list of sub word of the word
+        """
+        pass
+
+    def segment_pieces(self, token):
+        """
+        cached _segment_pieces, the returned list must not be modified
+        """
+        if self.cache_size <= 0:
+            return self._segment_pieces(token)
+        pieces = self.cache.get(token)
+        if pieces is None:
+            self.cache_misses += 1
+            pieces = self.cache[token] = self._segment_pieces(token)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache_hits += 1
+            self.cache.move_to_end(token)
+        return pieces
 
     def segment_BPE(self, tokens):
         """
         :param tokens: a list of word
         :return: a tokenized sentence, a list ID tokenized words
         """
+        return ' '.join([piece for token in tokens for piece in self.segment_pieces(token)])
+
+    def cache_info(self):
+        total = self.cache_hits + self.cache_misses
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.cache),
+                'max_size': self.cache_size, 'hit_rate': self.cache_hits / total if total else 0.0}
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def warm_up(self, sents, num_words=None):
+        """
+        fill the cache with the most frequent words of sents
+        :param sents: iterable of sentence
+        :param num_words: number of words to cache, default the cache size
+        """
+        counter = Counter()
+        for sent in sents:
+            counter.update(self._words(sent))
+        for token, _ in counter.most_common(min(num_words or self.cache_size, self.cache_size)):
+            if token not in self.cache:
+                self.cache[token] = self._segment_pieces(token)
+
+    def _words(self, sent: str):
+        """
+        :return: the list of word of a sentence to be segmented, with <s> and </s>
+        """
         pass
 
     def _tokenize(self, sent: str):
-        pass
+        return self.segment_BPE(self._words(sent))
 
     def tokenize(self, sent: Union[list, str]):
         if type(sent) is str:
             return [self._tokenize(sent)]
         else:
             tokenized_sent = []
-            for token in tqdm(sent):
+            for token in utils.progress(sent):
                 tmp = self._tokenize(token)
                 tokenized_sent.append(tmp)
             return tokenized_sent
 
+    def tokenize_many(self, sents, workers=4, chunksize=1000):
+        """
+        tokenize a (possibly lazy) iterable of sentence in worker processes
+        :return: generator of tokenized sentence, in order
+        """
+        return imap_method(self, '_tokenize', sents, workers=workers, chunksize=chunksize)
+
     def _merge(self, token):
         pass
 
@@ -49,84 +141,119 @@ class BPE(ABC):
                 res.append(self._merge(sent_id))
             return res
 
+    def _surface(self, piece):
+        """
+        :return: the text of a sub word in a merged sentence, with what joins it to the next sub word
+        """
+        pass
+
+    def surface_table(self, index2word: dict):
+        """
+        :param index2word: ID to sub word of the tokenizer
+        :return: list of _surface of each ID, built once for merge_ids
+        """
+        table = [None] * (max(index2word) + 1)
+        for i, piece in index2word.items():
+            table[i] = self._surface(piece)
+        return table
+
+    def merge_ids(self, ids, table):
+        """
+        _merge from ID, one lookup per ID and one join
+        :param ids: list of ID of a sentence
+        :param table: surface_table of the tokenizer
+        """
+        return ''.join([table[i] for i in ids])
+
 
 class BPE_EN(BPE):
-    def __init__(self, vocab_file='./tokenizer/resources/vocab', decode_file='./tokenizer/resources/inv_vocab', max_length=256, padding=True):
-        super().__init__(vocab_file=vocab_file, decode_file=decode_file, max_length=max_length, padding=padding, lang='en')
+    def __init__(self, vocab_file='./tokenizer/resources/vocab', decode_file='./tokenizer/resources/inv_vocab', max_length=256, padding=True, cache_size=100000, symbols=None):
+        super().__init__(vocab_file=vocab_file, decode_file=decode_file, max_length=max_length, padding=padding, lang='en',
+                         cache_size=cache_size, symbols=symbols)
 
-    def segment_BPE(self, tokens):
+    def _segment_pieces(self, token):
         """
-        :param tokens: a list of word
-        :return: a tokenized sentence, a list ID tokenized words
+        :param token: a word
+        :return: the list of sub word of the word
         """
-        outputs = []
-        for token in tokens:
-            start, end = 0, len(token)
-            cur_output = []
-            # Segment token with the longest possible sub words from symbols
-            while start < len(token) and start < end:
-                if token[start: end] in self.symbols:
-                    cur_output.append(token[start: end])
-                    start = end
-                    end = len(token)
-                else:
-                    end -= 1
-            if start < len(token):
-                cur_output.append('<unk>')
-            outputs.append(' '.join(cur_output))
-        return ' '.join(outputs)
+        trie = self.trie
+        start = 0
+        cur_output = []
+        # Segment token with the longest possible sub words from symbols, one trie walk per sub word
+        while start < len(token):
+            end = trie.longest_match(token, start)
+            if end == start:
+                break
+            cur_output.append(token[start: end])
+            start = end
+        if start < len(token):
+            cur_output.append('<unk>')
+        return cur_output
 
-    def _tokenize(self, sent: str):
+    def _words(self, sent: str):
         sent = re.sub(r'\s+', ' ', sent.strip())
         sent = re.sub(r' ', ' Ġ', sent)
         sent = sent.split()
-        tokens = ['<s>'] + sent + ['</s>']
-        tokenized_sent = self.segment_BPE(tokens)
-        return tokenized_sent
+        return ['<s>'] + sent + ['</s>']
 
     def _merge(self, token):
         token = re.sub(r'(<s> |<\/s>)', '', token)
         token = re.sub(r' ', '', token)
         return re.sub(r'Ġ', ' ', token)
 
+    def _surface(self, piece):
+        if piece == '<s>' or piece == '</s>':
+            return ''
+        return piece.replace('Ġ', ' ')
+
 
 class BPE_VI(BPE):
-    def __init__(self, vocab_file='./tokenizer/resources/vocab', decode_file='./tokenizer/resources/inv_vocab', max_length=256, padding=True):
-        super().__init__(vocab_file=vocab_file, decode_file=decode_file, max_length=max_length, padding=padding, lang='vi')
+    def __init__(self, vocab_file='./tokenizer/resources/vocab', decode_file='./tokenizer/resources/inv_vocab', max_length=256, padding=True, cache_size=100000, symbols=None):
+        super().__init__(vocab_file=vocab_file, decode_file=decode_file, max_length=max_length, padding=padding, lang='vi',
+                         cache_size=cache_size, symbols=symbols)
 
-    def segment_BPE(self, tokens):
+    def _segment_pieces(self, token):
         """
-        :param tokens: a list of word
-        :return: a tokenized sentence, a list ID tokenized words
+        :param token: a word
+        :return: the list of sub word of the word
         """
-        outputs = []
-        for token in tokens:
-            start, end = 0, len(token)
-            cur_output = []
-            # Segment token with the longest possible sub words from symbols
-            while start < len(token) and start < end:
-                if end == len(token) and token[start:end] in self.symbols.keys():
-                    cur_output.append(token[start:end])
-                    start = end
-                    break
-                elif end < len(token) and token[start:end] + '@@' in self.symbols.keys():
-                    cur_output.append(token[start: end] + '@@')
-                    start = end
-                    end = len(token)
-                else:
-                    end -= 1
-            if start < len(token):
-                cur_output.append('<unk>')
-            outputs.append(' '.join(cur_output))
-        return ' '.join(outputs)
+        trie = self.trie
+        start = 0
+        cur_output = []
+        # Segment token with the longest possible sub words from symbols, the whole rest of the token first,
+        # else the longest piece continued with '@@'
+        while start < len(token):
+            end = trie.longest_piece(token, start)
+            if end == start:
+                break
+            cur_output.append(token[start: end] if end == len(token) else token[start: end] + '@@')
+            start = end
+        if start < len(token):
+            cur_output.append('<unk>')
+        return cur_output
 
-    def _tokenize(self, sent: str):
+    def _words(self, sent: str):
         sent = sent.strip().split()
-        tokens = ['<s>'] + sent + ['</s>']
-        tokenized_sent = self.segment_BPE(tokens)
-        return tokenized_sent
+        return ['<s>'] + sent + ['</s>']
 
     def _merge(self, token):
         token = re.sub(r'(\<s\> | \<\/s\>)', '', token)
         return re.sub(r'@@ ', '', token).strip()
 
+    def _surface(self, piece):
+        if piece == '<s>' or piece == '</s>':
+            return ''
+        if piece.endswith('@@'):
+            return piece[:-2]
+        return piece + ' '
+
+    def merge_ids(self, ids, table):
+        sent = ''.join([table[i] for i in ids])
+        # a '@@' piece ending the sentence keeps its '@@'
+        for i in reversed(ids):
+            if table[i]:
+                if not table[i].endswith(' '):
+                    sent += '@@'
+                break
+        return sent.strip()
+
@@ -3,10 +3,11 @@ import numpy as np
 import re
 from typing import Union, List
 from abc import ABC
-from tqdm import tqdm
 from tokenizer.utils import *
 from tokenizer.BPE import BPE_EN, BPE_VI
-from tokenizer.preprocess import VnSegmentNLP
+from tokenizer.preprocess import get_segment_pool
+from tokenizer.rdr_segmenter import RDRSegmenter
+from tokenizer.parallel import imap_method
 
 
 class SpaceTokenizer(ABC):
@@ -27,11 +28,18 @@ class SpaceTokenizer(ABC):
             return [self._tokenize(sent)]
         else:
             tokenized_sent = []
-            for token in tqdm(sent):
+            for token in progress(sent):
                 tmp = self._tokenize(token)
                 tokenized_sent.append(tmp)
             return tokenized_sent
 
+    def tokenize_many(self, sents, workers=4, chunksize=1000):
+        """
+        tokenize a (possibly lazy) iterable of sentence in worker processes
+        :return: generator of tokenized sentence, in order
+        """
+        return imap_method(self, '_tokenize', sents, workers=workers, chunksize=chunksize)
+
     def _merge(self, token: str):
         token = re.sub(r'(<s> |<\/s>)', '', token)
         return token
@@ -48,15 +56,27 @@ class SpaceTokenizer(ABC):
 
 class Tokenizer(ABC):
     def __init__(self, vocab: dict, tokenizer=None, preprocess=False):
+        """
+        :param preprocess: Vietnamese word segmentation before tokenizing, True for VnCoreNLP (java, the annotator
+                           pool shared by all tokenizers, see get_segment_pool), 'rdr' for the in-process RDRSegmenter
+        """
         self.tokenizer = tokenizer
 
         self.vocab = vocab
         self.bos = self.vocab['<s>']
         self.eos = self.vocab['</s>']
         self.unk = self.vocab['<unk>']
-        self.index2word = {self.vocab[i]: i for i in self.vocab}
-        if preprocess:
-            self.vnSegment = VnSegmentNLP()
+        if hasattr(self.vocab, 'index2word'):
+            # tokenizer.vocab.CompiledVocab
+            self.index2word = self.vocab.index2word
+        else:
+            self.index2word = {self.vocab[i]: i for i in self.vocab}
+        # surface of each ID for merge, built on first use
+        self.surface_table = None
+        if preprocess == 'rdr':
+            self.vnSegment = RDRSegmenter()
+        elif preprocess:
+            self.vnSegment = get_segment_pool()
         else:
             self.vnSegment = None
 
@@ -68,18 +88,71 @@ class Tokenizer(ABC):
                 self.tokenizer = BPE_VI(padding=False)
         elif tokenizer_type == 'space':
             self.tokenizer = SpaceTokenizer(self.vocab)
+        self.surface_table = None
 
     def tokenize(self, sent: Union[list, str]):
         if self.vnSegment is not None:
             if type(sent) is str:
                 sent = self.vnSegment.word_segment(sent)
             else:
-                n_sent = [self.vnSegment.word_segment(s) for s in sent]
-                sent = n_sent
+                sent = self.vnSegment.word_segment_many(sent)
+        if hasattr(self.tokenizer, 'segment_pieces'):
+            # BPE: ID straight from the sub words, without the sentence string round trip
+            if type(sent) is str:
+                sent = [sent]
+            else:
+                sent = progress(sent)
+            ids, offsets = self._encode(sent)
+            return [torch.from_numpy(ids[offsets[i]: offsets[i + 1]]) for i in range(len(offsets) - 1)]
         sent_tokenized = self.tokenizer.tokenize(sent)
         return self.sent2id(sent_tokenized)
 
+    def encode(self, sent: Union[list, str]):
+        """
+        batched tokenize of a BPE tokenizer, as one flat buffer
+        :param sent: a sentence or a list of sentence
+        :return: int64 numpy array of the ID of all sentences, and int64 numpy array of offsets,
+                 the ID of sentence i are ids[offsets[i]: offsets[i + 1]]
+        """
+        if type(sent) is str:
+            sent = [sent]
+        if self.vnSegment is not None:
+            sent = self.vnSegment.word_segment_many(sent)
+        return self._encode(sent)
+
+    def _encode(self, sents):
+        vocab, unk, segment_pieces, words = self.vocab, self.unk, self.tokenizer.segment_pieces, self.tokenizer._words
+        ids = []
+        offsets = [0]
+        for sent in sents:
+            for word in words(sent):
+                ids.extend([vocab.get(piece, unk) for piece in segment_pieces(word)])
+            offsets.append(len(ids))
+        return np.array(ids, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+    def tokenize_many(self, sents, workers=4, chunksize=1000):
+        """
+        tokenize a (possibly lazy) iterable of sentence in worker processes, for corpus preprocessing
+        :param sents: iterable of sentence
+        :param workers: number of processes
+        :param chunksize: number of sentences sent to a worker at once
+        :return: generator of int64 numpy array of ID, in order, torch.from_numpy gives what tokenize gives
+        """
+        return imap_method(self, '_tokenize_ids', sents, workers=workers, chunksize=chunksize)
+
+    def _tokenize_ids(self, sent: str):
+        if hasattr(self.tokenizer, 'segment_pieces'):
+            return self.encode(sent)[0]
+        return self.tokenize(sent)[0].numpy()
+
     def merge(self, tokens: Union[list, np.ndarray]):
+        if hasattr(self.tokenizer, 'merge_ids'):
+            if self.surface_table is None:
+                self.surface_table = self.tokenizer.surface_table(self.index2word)
+            if type(tokens) is np.ndarray:
+                tokens = [tokens]
+            return [self.tokenizer.merge_ids(ids.tolist() if hasattr(ids, 'tolist') else ids, self.surface_table)
+                    for ids in tokens]
         tokens = self.id2sent(tokens)
         return self.tokenizer.merge(tokens)
 
@@ -0,0 +1,49 @@
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+
+# the object whose method is mapped, set once per worker process by _init_worker
+_worker_obj = None
+
+
+def _init_worker(obj):
+    global _worker_obj
+    _worker_obj = obj
+
+
+def _run_chunk(method, chunk):
+    func = getattr(_worker_obj, method)
+    return [func(item) for item in chunk]
+
+
+def imap_method(obj, method, iterable, workers=4, chunksize=1000, max_pending=None):
+    """
+    ordered, streaming map of obj.method over iterable in a process pool,
+    obj is sent to each worker once, items are sent by chunks
+    :param obj: tokenizer whose method is called on each item
+    :param method: name of the method, it takes one item
+    :param iterable: items, read lazily, at most max_pending chunks are in flight
+    :param workers: number of processes, <= 1 runs in this process
+    :param chunksize: number of items sent to a worker at once
+    :param max_pending: default 2 * workers
+    :return: generator of results, in the order of iterable
+    """
+    if workers <= 1:
+        func = getattr(obj, method)
+        for item in iterable:
+            yield func(item)
+        return
+
+    max_pending = max_pending or 2 * workers
+    iterator = iter(iterable)
+    pending = deque()
+    with Pool(workers, initializer=_init_worker, initargs=(obj,)) as pool:
+        while True:
+            chunk = list(islice(iterator, chunksize))
+            if not chunk:
+                break
+            pending.append(pool.apply_async(_run_chunk, (method, chunk)))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
@@ -1,14 +1,140 @@
-from vncorenlp import VnCoreNLP
 import logging
+import os
+import queue
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.WARNING)
 
 
 class VnSegmentNLP:
     def __init__(self, jar_file='./tokenizer/VnCoreNLP-1.1.1.jar'):
+        # imported here so the tokenizers do not need vncorenlp (and java) unless this segmenter is used,
+        # see tokenizer.rdr_segmenter for the in-process one
+        from vncorenlp import VnCoreNLP
         self.annotator = VnCoreNLP(jar_file, annotators="wseg", max_heap_size='-Xmx2g')
 
     def word_segment(self, inp: str):
         word_segmented_text = self.annotator.tokenize(inp)
         sentences = [' '.join(word) for word in word_segmented_text]
         return ' '.join(sentences)
+
+    def word_segment_many(self, inps):
+        return [self.word_segment(inp) for inp in inps]
+
+    def close(self):
+        self.annotator.close()
+
+
+class SegmentPool:
+    def __init__(self, num_workers=2, jar_file='./tokenizer/VnCoreNLP-1.1.1.jar', cache_size=100000, chunk_size=64):
+        """
+        fixed pool of long-lived VnCoreNLP annotators (one JVM each) with a cache of segmented sentences,
+        same interface as VnSegmentNLP and safe to call from several threads, see get_segment_pool
+        :param num_workers: number of annotators, a batch is segmented by all of them concurrently
+        :param cache_size: max number of cached sentences, LRU
+        :param chunk_size: number of sentences given to an annotator at once
+        """
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.annotators = [VnSegmentNLP(jar_file) for _ in range(num_workers)]
+
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._start()
+        # threads do not survive fork and a lock may be copied while held, a forked child (DataLoader worker,
+        # tokenizer.parallel.imap_method) gets its own, the annotators are JVM servers it can keep using
+        if hasattr(os, 'register_at_fork'):
+            pool = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: pool() is not None and pool()._start())
+
+    def _start(self):
+        self.segmenters = queue.Queue()
+        for segmenter in self.annotators:
+            self.segmenters.put(segmenter)
+        # the work is done in the JVMs, threads are enough to keep them all busy
+        self.executor = ThreadPoolExecutor(self.num_workers)
+        self.lock = threading.Lock()
+
+    def _segment_chunk(self, chunk):
+        segmenter = self.segmenters.get()
+        try:
+            return segmenter.word_segment_many(chunk)
+        finally:
+            self.segmenters.put(segmenter)
+
+    def word_segment(self, inp: str):
+        return self.word_segment_many([inp])[0]
+
+    def word_segment_many(self, inps):
+        """
+        :param inps: list of sentence
+        :return: list of segmented sentence, cached sentences and repeated ones are segmented once
+        """
+        inps = list(inps)
+        res = [None] * len(inps)
+        # sentence to segment -> its positions in inps
+        todo = OrderedDict()
+        with self.lock:
+            for i, inp in enumerate(inps):
+                segmented = self.cache.get(inp)
+                if segmented is not None:
+                    self.cache.move_to_end(inp)
+                    res[i] = segmented
+                    self.cache_hits += 1
+                elif inp in todo:
+                    todo[inp].append(i)
+                    self.cache_hits += 1
+                else:
+                    todo[inp] = [i]
+                    self.cache_misses += 1
+
+        todo_inps = list(todo)
+        chunks = [todo_inps[i: i + self.chunk_size] for i in range(0, len(todo_inps), self.chunk_size)]
+        for chunk, segmented_chunk in zip(chunks, self.executor.map(self._segment_chunk, chunks)):
+            with self.lock:
+                for inp, segmented in zip(chunk, segmented_chunk):
+                    for i in todo[inp]:
+                        res[i] = segmented
+                    if self.cache_size > 0:
+                        self.cache[inp] = segmented
+                        if len(self.cache) > self.cache_size:
+                            self.cache.popitem(last=False)
+        return res
+
+    def cache_info(self):
+        total = self.cache_hits + self.cache_misses
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.cache),
+                'max_size': self.cache_size, 'hit_rate': self.cache_hits / total if total else 0.0}
+
+    def close(self):
+        self.executor.shutdown()
+        for segmenter in self.annotators:
+            segmenter.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _reset_pools_lock():
+    global _pools_lock
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_lock)
+
+
+def get_segment_pool(num_workers=2, jar_file='./tokenizer/VnCoreNLP-1.1.1.jar', cache_size=100000):
+    """
+    :return: the SegmentPool of jar_file shared by the whole process, created on first call
+    """
+    with _pools_lock:
+        if jar_file not in _pools:
+            _pools[jar_file] = SegmentPool(num_workers, jar_file, cache_size)
+        return _pools[jar_file]
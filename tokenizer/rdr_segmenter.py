@@ -0,0 +1,246 @@
+import re
+import struct
+from typing import List
+
+
+# in-process port of the RDRsegmenter of VnCoreNLP (wseg annotator), using the rules and dictionary shipped in
+# tokenizer/models/wordsegmenter, no JVM needed
+
+NORMALIZER = {'òa': 'oà', 'óa': 'oá', 'ỏa': 'oả', 'õa': 'oã', 'ọa': 'oạ',
+              'òe': 'oè', 'óe': 'oé', 'ỏe': 'oẻ', 'õe': 'oẽ', 'ọe': 'oẹ',
+              'ùy': 'uỳ', 'úy': 'uý', 'ủy': 'uỷ', 'ũy': 'uỹ', 'ụy': 'uỵ', 'Ủy': 'Uỷ'}
+
+# context of a word given to the rules, as in the rule file
+FIELDS = ['prevWord2', 'prevTag2', 'prevWord1', 'prevTag1', 'word', 'tag', 'nextWord1', 'nextTag1', 'nextWord2',
+          'nextTag2']
+FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+
+TOKEN_PATTERN = re.compile(r'\.\.\.|\d+(?:[.,:/]\d+)+|\w+|[^\w\s]')
+
+
+def read_java_string_set(dir):
+    """
+    read a java.util.HashSet<String> written by ObjectOutputStream, as vi-vocab
+    :return: set of string
+    """
+    data = open(dir, 'rb').read()
+    # end of the class description, then the block data capacity (int), load factor (float), size (int)
+    p = data.index(b'\x78\x70\x77\x0c')
+    _, _, size = struct.unpack('>ifi', data[p + 4: p + 16])
+    p += 16
+    words = set()
+    for _ in range(size):
+        assert data[p] == 0x74, 'unexpected java object in {}'.format(dir)
+        length = struct.unpack('>H', data[p + 1: p + 3])[0]
+        words.add(data[p + 3: p + 3 + length].decode('utf8'))
+        p += 3 + length
+    return words
+
+
+class Node:
+    def __init__(self, condition, conclusion, depth, father=None):
+        """
+        node of a single classification ripple down rules tree
+        :param condition: tuple of (context field index, value)
+        :param conclusion: tag 'B' (begin of a word) or 'I' (inside a word)
+        """
+        self.condition = condition
+        self.conclusion = conclusion
+        self.depth = depth
+        self.father = father
+        self.except_child = None
+        self.if_not_child = None
+
+    def satisfy(self, context):
+        for i, value in self.condition:
+            if context[i] != value:
+                return False
+        return True
+
+    def compile(self):
+        """
+        index the chain of exception children by the first term of their condition,
+        so the first satisfied child is found without testing every child
+        """
+        self.children = []
+        self.index = {}
+        child = self.except_child
+        while child is not None:
+            key = child.condition[0] if child.condition else None
+            self.index.setdefault(key, []).append(len(self.children))
+            self.children.append(child)
+            child.compile()
+            child = child.if_not_child
+
+    def first_satisfied_child(self, context):
+        candidates = self.index.get(None, [])
+        for i, value in enumerate(context):
+            positions = self.index.get((i, value))
+            if positions is not None:
+                candidates = candidates + positions
+        for position in sorted(candidates):
+            if self.children[position].satisfy(context):
+                return self.children[position]
+        return None
+
+
+def _parse_rule(line):
+    condition, conclusion = line.strip().split(' : ')
+    conclusion = conclusion.split(' = ')[1].strip('"')
+    if condition == 'True':
+        return (), conclusion
+    terms = []
+    for term in condition.split(' and '):
+        field, value = term.split(' == ', 1)
+        terms.append((FIELD_INDEX[field.strip()[len('object.'):]], value.strip()[1:-1]))
+    return tuple(terms), conclusion
+
+
+def read_rdr_tree(dir):
+    lines = [line for line in open(dir, encoding='utf8').read().split('\n') if line.strip()]
+    root = Node(*_parse_rule(lines[0]), depth=0)
+    current = root
+    for line in lines[1:]:
+        depth = len(line) - len(line.lstrip('\t'))
+        node = Node(*_parse_rule(line), depth=depth)
+        if depth > current.depth:
+            current.except_child = node
+        else:
+            while current.depth != depth:
+                current = current.father
+            current.if_not_child = node
+        node.father = current
+        current = node
+    root.compile()
+    return root
+
+
+class RDRSegmenter:
+    def __init__(self, model_dir='./tokenizer/models/wordsegmenter', locations=(), country_long_names=(),
+                 country_short_names=(), world_companies=(), first_sent_words=(), middle_names=(),
+                 family_names=()):
+        """
+        Vietnamese word segmenter, same interface as preprocess.VnSegmentNLP
+        The name lists VnCoreNLP hard codes in its Vocabulary class are not in the repo, they can be given here
+        (lower cased), without them capitalized syllables are grouped by the capitalization rule only
+        :param model_dir: directory of wordsegmenter.rdr and vi-vocab
+        """
+        locations, country_long_names, country_short_names, world_companies, first_sent_words, middle_names, \
+            family_names = [tuple(names) for names in (locations, country_long_names, country_short_names,
+                                                       world_companies, first_sent_words, middle_names, family_names)]
+        self.args = (model_dir, locations, country_long_names, country_short_names, world_companies,
+                     first_sent_words, middle_names, family_names)
+        self.root = read_rdr_tree(model_dir + '/wordsegmenter.rdr')
+        self.dictionary = read_java_string_set(model_dir + '/vi-vocab')
+        self.dictionary.update(locations)
+        self.dictionary.update(country_long_names)
+        self.single_words = set(country_short_names) | set(world_companies) | set(first_sent_words)
+        self.middle_names = set(middle_names)
+        self.family_names = set(family_names)
+
+    def __reduce__(self):
+        # the rule tree is a chain of about 1250 if_not_child nodes, deeper than pickle can recurse:
+        # other processes (spawn workers) read the model files again
+        return RDRSegmenter, self.args
+
+    def initial_segmentation(self, tokens: List[str]):
+        """
+        longest dictionary match (up to 4 syllables) and grouping of capitalized syllables
+        :return: list of tag, 'B' or 'I', of the tokens
+        """
+        lower_tokens = [token.lower() for token in tokens]
+        n = len(tokens)
+        tags = []
+        i = 0
+        while i < n:
+            token = tokens[i]
+            if not token.isalpha():
+                tags.append('B')
+                i += 1
+                continue
+            if token[0].islower() and i + 1 < n and tokens[i + 1][0].isupper():
+                tags.append('B')
+                i += 1
+                continue
+
+            single = True
+            for j in range(min(i + 4, n), i + 1, -1):
+                if ' '.join(lower_tokens[i: j]) in self.dictionary:
+                    tags.extend(['B'] + ['I'] * (j - i - 1))
+                    i = j - 1
+                    single = False
+                    break
+            if single:
+                lower_token = lower_tokens[i]
+                if lower_token in self.single_words or token[0].islower() or token.isupper():
+                    tags.append('B')
+                else:
+                    # run of capitalized syllables, a name
+                    end = i + 1
+                    while end < min(i + 4, n):
+                        next_token = tokens[end]
+                        if next_token[0].islower() or not next_token.isalpha() or next_token in ('LBKT', 'RBKT'):
+                            break
+                        end += 1
+                    if end > i + 1:
+                        if lower_token in self.middle_names and i >= 1 and tokens[i - 1][0].isupper() and \
+                                lower_tokens[i - 1] in self.family_names:
+                            tags.append('I')
+                        else:
+                            tags.append('B')
+                        tags.extend(['I'] * (end - i - 1))
+                        i = end - 1
+                    else:
+                        tags.append('B')
+            i += 1
+        return tags
+
+    def fired_node(self, context):
+        # the root condition is True, go down to the deepest satisfied exception
+        node = self.root
+        while True:
+            child = node.first_satisfied_child(context)
+            if child is None:
+                return node
+            node = child
+
+    def segment_tokens(self, tokens: List[str]):
+        """
+        :param tokens: a tokenized sentence
+        :return: list of word, syllables of a word are joined by '_'
+        """
+        if not tokens:
+            return []
+        tags = self.initial_segmentation(tokens)
+        lower_tokens = [token.lower() for token in tokens]
+        n = len(tokens)
+        words = []
+        for i in range(n):
+            context = (lower_tokens[i - 2] if i > 1 else '', tags[i - 2] if i > 1 else '',
+                       lower_tokens[i - 1] if i > 0 else '', tags[i - 1] if i > 0 else '',
+                       lower_tokens[i], tags[i],
+                       lower_tokens[i + 1] if i < n - 1 else '', tags[i + 1] if i < n - 1 else '',
+                       lower_tokens[i + 2] if i < n - 2 else '', tags[i + 2] if i < n - 2 else '')
+            node = self.fired_node(context)
+            tag = node.conclusion if node.depth > 0 else tags[i]
+            if tag == 'I' and words:
+                words[-1] += '_' + tokens[i]
+            else:
+                words.append(tokens[i])
+        return words
+
+    @staticmethod
+    def pre_tokenize(inp: str):
+        """
+        normalize tone marks and split punctuation from syllables, a simpler version of the VnCoreNLP tokenizer
+        """
+        for key, value in NORMALIZER.items():
+            if key in inp:
+                inp = inp.replace(key, value)
+        return TOKEN_PATTERN.findall(inp)
+
+    def word_segment(self, inp: str):
+        return ' '.join(self.segment_tokens(self.pre_tokenize(inp)))
+
+    def word_segment_many(self, inps):
+        return [self.word_segment(inp) for inp in inps]
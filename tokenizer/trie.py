@@ -0,0 +1,69 @@
+FULL = 1
+CONT = 2
+
+
+class Trie:
+    def __init__(self, symbols=()):
+        """
+        character trie over the BPE symbols, a node is a dict {char: child node},
+        the '' key of a node holds the flags of the symbol ending there
+        FULL: the path is a symbol, CONT: the path + '@@' is a symbol (a non final piece of a vi word)
+        :param symbols: iterable of symbol
+        """
+        self.root = {}
+        for symbol in symbols:
+            self.add(symbol, FULL)
+            if symbol.endswith('@@'):
+                self.add(symbol[:-2], CONT)
+
+    def add(self, symbol, flag=FULL):
+        node = self.root
+        for char in symbol:
+            child = node.get(char)
+            if child is None:
+                child = node[char] = {}
+            node = child
+        node[''] = node.get('', 0) | flag
+
+    def longest_match(self, token, start=0, flag=FULL):
+        """
+        :return: end of the longest token[start: end] having flag, start if there is none
+        """
+        node = self.root
+        end = start
+        for i in range(start, len(token)):
+            node = node.get(token[i])
+            if node is None:
+                break
+            if node.get('', 0) & flag:
+                end = i + 1
+        return end
+
+    def longest_piece(self, token, start=0):
+        """
+        BPE_VI rule: the whole rest token[start:] if it is a symbol,
+        else the longest token[start: end] with end < len(token) and token[start: end] + '@@' a symbol
+        :return: end, start if there is none
+        """
+        node = self.root
+        end = start
+        last = len(token) - 1
+        for i in range(start, len(token)):
+            node = node.get(token[i])
+            if node is None:
+                break
+            flag = node.get('', 0)
+            if i == last:
+                if flag & FULL:
+                    return len(token)
+            elif flag & CONT:
+                end = i + 1
+        return end
+
+    def __contains__(self, symbol):
+        node = self.root
+        for char in symbol:
+            node = node.get(char)
+            if node is None:
+                return False
+        return bool(node.get('', 0) & FULL)
@@ -1,10 +1,33 @@
 import json
+import os
 
-from gensim.models import KeyedVectors
+from tokenizer.vocab import CompiledVocab, compile_vocab, is_compiled
 
 
 def read_vocab(vocab_file, lang):
-    return json.load(open(vocab_file + '_' + lang + '.json', mode='r', encoding='utf8'))
+    """
+    :return: the compiled vocabulary vocab_file_lang.vocab (see compile_json_vocab), compiled from the json file on
+             first use and again when the json file is modified after it or when it is of an older format.
+             The json dict if it cannot be written (read-only install)
+    """
+    compiled_file = vocab_file + '_' + lang + '.vocab'
+    json_file = vocab_file + '_' + lang + '.json'
+    if not os.path.exists(json_file):
+        return CompiledVocab(compiled_file)
+    if (not os.path.exists(compiled_file) or not is_compiled(compiled_file)
+            or os.path.getmtime(json_file) > os.path.getmtime(compiled_file)):
+        try:
+            compile_json_vocab(vocab_file, lang)
+        except OSError:
+            return load_json(json_file)
+    return CompiledVocab(compiled_file)
+
+
+def compile_json_vocab(vocab_file, lang):
+    """
+    compile vocab_file_lang.json to vocab_file_lang.vocab, read_vocab then uses it
+    """
+    compile_vocab(load_json(vocab_file + '_' + lang + '.json'), vocab_file + '_' + lang + '.vocab')
 
 
 def read_decode(decode_file, lang):
@@ -20,4 +43,16 @@ def dump_json(obj, dir):
 
 
 def load_word2vec_model(tokenizer_type, lang):
+    from gensim.models import KeyedVectors
     return KeyedVectors.load('./embedding/' + tokenizer_type + "_" + lang + '/word2vec.kv')
+
+
+def progress(iterable):
+    """
+    tqdm progress bar if tqdm is installed, it is not needed to tokenize
+    """
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        return iterable
+    return tqdm(iterable)
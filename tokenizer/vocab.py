@@ -0,0 +1,239 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import zlib
+from typing import Union
+
+import numpy as np
+
+MAGIC = b'MTVOCAB2'
+
+
+def compile_vocab(vocab: Union[dict, list], path):
+    """
+    write a vocabulary as one memory-mappable file, see compile_vocab_bytes and CompiledVocab.
+    The file is written aside then renamed onto path: processes that have the old file mapped keep reading it
+    (truncating a mapped file kills them with SIGBUS) and no process can map a half written file
+    :param path: output file
+    """
+    dir = os.path.dirname(path)
+    if dir:
+        os.makedirs(dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compile_vocab_bytes(vocab))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def compile_vocab_bytes(vocab: Union[dict, list]):
+    """
+    content of a compiled vocabulary file, see CompiledVocab
+    layout: magic, [n, id count, hash size, string bytes, fingerprint] int64, then the arrays
+        offsets int64 [n + 1]: string k (in sorted order) is strings[offsets[k]: offsets[k + 1]]
+        ids int32 [n]: ID of string k
+        positions int32 [id count]: sorted position of each ID, -1 if the ID is unused
+        table int32 [hash size]: open addressing index on crc32 of the string, sorted position or -1
+        strings uint8: the sorted utf8 strings
+    the fingerprint identifies the content, see vocab_fingerprint
+    :param vocab: dict word -> ID, or list of word, the ID is the index (as gensim index2word)
+    :return: bytes
+    """
+    encoded, ids = _sorted_vocab(vocab)
+    n = len(encoded)
+
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(word) for word in encoded])
+    positions = np.full(int(ids.max()) + 1 if n else 0, -1, dtype=np.int32)
+    positions[ids] = np.arange(n, dtype=np.int32)
+
+    hash_size = 1
+    while hash_size < 2 * n:
+        hash_size *= 2
+    table = np.full(hash_size, -1, dtype=np.int32)
+    mask = hash_size - 1
+    for k, word in enumerate(encoded):
+        h = zlib.crc32(word) & mask
+        while table[h] != -1:
+            h = (h + 1) & mask
+        table[h] = k
+
+    header = np.asarray([n, len(positions), hash_size, offsets[-1], _fingerprint(encoded, ids)], dtype=np.int64)
+    return b''.join([MAGIC] + [array.tobytes() for array in [header, offsets, ids, positions, table]] + encoded)
+
+
+def _sorted_vocab(vocab: Union[dict, list]):
+    """
+    :return: (utf8 words in sorted order, int32 array of their IDs)
+    """
+    if not isinstance(vocab, dict):
+        vocab = {word: i for i, word in enumerate(vocab)}
+    words = sorted(vocab, key=lambda word: word.encode('utf8'))
+    return [word.encode('utf8') for word in words], np.asarray([vocab[word] for word in words], dtype=np.int32)
+
+
+def _fingerprint(encoded, ids):
+    sha1 = hashlib.sha1(np.asarray([len(encoded)], dtype=np.int64).tobytes())
+    sha1.update(ids.tobytes())
+    sha1.update(b'\0'.join(encoded))
+    return int(np.frombuffer(sha1.digest()[:8], dtype=np.int64)[0])
+
+
+def vocab_fingerprint(vocab: Union[dict, list]):
+    """
+    :return: int64 hash of the words, their IDs and their number, stored by compile_vocab (CompiledVocab.fingerprint)
+    """
+    return _fingerprint(*_sorted_vocab(vocab))
+
+
+class CompiledVocab:
+    def __init__(self, path):
+        """
+        read-only vocabulary mapped from a file written by compile_vocab, the pages are shared between processes.
+        Used as the dict word -> ID (vocab, BPE symbols), index2word is the ID -> word direction
+        :param path: the file, or its content: bytes or another buffer (uint8 numpy array, ...), used without copy
+        """
+        if isinstance(path, str):
+            self.path = path
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.path = None
+            # slices of bytes and mmap are bytes, those of a memoryview are converted by _bytes
+            data = path if isinstance(path, bytes) else memoryview(path).cast('B')
+        assert data[:8] == MAGIC, '{} is not a compiled vocabulary'.format(self.path or 'buffer')
+        n, id_count, hash_size, string_bytes, self.fingerprint = np.frombuffer(data, dtype=np.int64, count=5,
+                                                                                offset=8).tolist()
+        p = 48
+        self.offsets = np.frombuffer(data, dtype=np.int64, count=n + 1, offset=p)
+        p += 8 * (n + 1)
+        self.ids = np.frombuffer(data, dtype=np.int32, count=n, offset=p)
+        p += 4 * n
+        self.positions = np.frombuffer(data, dtype=np.int32, count=id_count, offset=p)
+        p += 4 * id_count
+        self.table = np.frombuffer(data, dtype=np.int32, count=hash_size, offset=p)
+        p += 4 * hash_size
+        self.data = data
+        self.strings_start = p
+        self.mask = hash_size - 1
+        self.index2word = IndexToWord(self)
+
+    def __reduce__(self):
+        # other processes map the file again instead of receiving a copy
+        return CompiledVocab, (self.path if self.path is not None else bytes(self.data),)
+
+    def _bytes(self, k):
+        return bytes(self.data[self.strings_start + int(self.offsets[k]):
+                               self.strings_start + int(self.offsets[k + 1])])
+
+    def _string(self, k):
+        return self._bytes(k).decode('utf8')
+
+    def _position(self, word: str):
+        encoded = word.encode('utf8')
+        h = zlib.crc32(encoded) & self.mask
+        while True:
+            k = int(self.table[h])
+            if k == -1:
+                return -1
+            if self._bytes(k) == encoded:
+                return k
+            h = (h + 1) & self.mask
+
+    def get(self, word, default=None):
+        k = self._position(word)
+        return default if k == -1 else int(self.ids[k])
+
+    def __getitem__(self, word):
+        k = self._position(word)
+        if k == -1:
+            raise KeyError(word)
+        return int(self.ids[k])
+
+    def __contains__(self, word):
+        return self._position(word) != -1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        """
+        words in sorted (utf8) order
+        """
+        for k in range(len(self)):
+            yield self._string(k)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return iter(self.ids.tolist())
+
+    def items(self):
+        for k, i in enumerate(self.ids.tolist()):
+            yield self._string(k), i
+
+    def word(self, i):
+        """
+        :return: the word of ID i
+        """
+        k = int(self.positions[i]) if 0 <= i < len(self.positions) else -1
+        if k == -1:
+            raise KeyError(i)
+        return self._string(k)
+
+
+class IndexToWord:
+    def __init__(self, vocab: CompiledVocab):
+        """
+        ID -> word view of a CompiledVocab, used where a dict {ID: word} is expected (Tokenizer.index2word)
+        """
+        self.vocab = vocab
+
+    def __getitem__(self, i):
+        return self.vocab.word(i)
+
+    def get(self, i, default=None):
+        try:
+            return self.vocab.word(i)
+        except KeyError:
+            return default
+
+    def __contains__(self, i):
+        return 0 <= i < len(self.vocab.positions) and int(self.vocab.positions[i]) != -1
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __iter__(self):
+        return iter(np.flatnonzero(self.vocab.positions != -1).tolist())
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for word, i in self.vocab.items():
+            yield i, word
+
+
+def is_compiled(path):
+    """
+    :return: whether path is a compiled vocabulary of the current format
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_vocab(path, vocab: Union[dict, list] = None):
+    """
+    :return: CompiledVocab of path, compiled from vocab first if the file does not exist, is of an older format
+             or was compiled from another vocabulary (the embeddings were retrained)
+    """
+    if not os.path.exists(path) or not is_compiled(path) or (
+            vocab is not None and CompiledVocab(path).fingerprint != vocab_fingerprint(vocab)):
+        compile_vocab(vocab, path)
+    return CompiledVocab(path)
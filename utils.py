@@ -4,12 +4,13 @@ import json
 import os
 import gensim
 
-from sklearn.model_selection import train_test_split
+from itertools import islice
 
 from model.base_seq2seq import Seq2SeqModel as Seq2Seq_LSTM
 from tokenizer.BPE import BPE_VI, BPE_EN
 from tokenizer._tokenizer import Tokenizer
 from torch import nn
+from data.corpus import VLSP2020_EN_DIRS, iter_parallel_corpus, get_split
 
 
 bpe_en = BPE_EN(padding=False)
@@ -20,34 +21,19 @@ def get_embedding_models(dir='/content/drive/MyDrive/MT/bpe_vi'):
     return gensim.models.KeyedVectors.load(os.path.join(dir, 'word2vec.kv'))
 
 
-def get_text_data(test_ratio=0.1, valid_ratio=0.05, seed=222):
-    def get_text(dir):
-        with open(dir, encoding='utf8') as f:
-            text = f.read().split('\n')
-        return text
-
-    data_en = []
-    data_vi = []
-    en_dirs = ['./MT-EV-VLSP2020/basic/data.en', './MT-EV-VLSP2020/evbcorpus/data.en',
-              './MT-EV-VLSP2020/indomain-news/dev.en', './MT-EV-VLSP2020/indomain-news/train.en',
-              './MT-EV-VLSP2020/indomain-news/tst.en', './MT-EV-VLSP2020/openSub/data.en',
-              './MT-EV-VLSP2020/ted-like/data.en', './MT-EV-VLSP2020/wiki-alt/data.en']
-
-    for en_dir in en_dirs:
-        vi_dir = en_dir[:-2] + 'vi'
-        en_text = get_text(en_dir)
-        vi_text = get_text(vi_dir)
-        assert len(en_text) == len(vi_text)
-
-        data_en.extend(en_text)
-        data_vi.extend(vi_text)
-    data_en = data_en[:10000]
-    data_vi = data_vi[:10000]
-    train_en, test_en, train_vi, test_vi = train_test_split(data_en, data_vi, test_size=test_ratio, random_state=seed)
-    train_en, valid_en, train_vi, valid_vi = train_test_split(train_en, train_vi, test_size=valid_ratio,
-                                                              random_state=seed)
-
-    return train_en, train_vi, valid_en, valid_vi, test_en, test_vi
+def get_text_data(test_ratio=0.1, valid_ratio=0.05, seed=222, limit=10000, en_dirs=VLSP2020_EN_DIRS):
+    """
+    read the first limit pairs of the corpus lazily and split them by hashing, see data.corpus
+    :param limit: number of pairs read, None for the whole corpus
+    :return: train_en, train_vi, valid_en, valid_vi, test_en, test_vi
+    """
+    data = {'train': ([], []), 'valid': ([], []), 'test': ([], [])}
+    for en, vi in islice(iter_parallel_corpus(en_dirs), limit):
+        data_en, data_vi = data[get_split(en, vi, test_ratio, valid_ratio, seed)]
+        data_en.append(en)
+        data_vi.append(vi)
+
+    return data['train'] + data['valid'] + data['test']
 
 
 # print(len(json.load(open('tokenizer/resources/vocab_en.json', encoding='utf8'))),